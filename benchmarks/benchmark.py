@@ -0,0 +1,253 @@
+"""
+benchmark MultiQueryset on file backed sqlite databases
+
+    python benchmarks/benchmark.py --databases 2,4 --rows 10000,100000 \
+        --output bench.json
+    python benchmarks/benchmark.py --compare bench.json --threshold 1.2
+
+every case loads `rows` rows spread over `databases` databases, then times
+the ordered merge, iterator(), count(), get(), slicing and keyset pagination
+and measures the peak memory of the merge. With --compare the run fails if
+a benchmark is slower than the baseline by more than the threshold.
+"""
+
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import django
+from django.conf import settings
+
+BENCHMARKS = [
+    "merge", "iterator", "count", "get", "first_page", "deep_page",
+    "after", "merge_memory", "iterator_memory",
+]
+
+
+def configure(directory, max_databases):
+    """
+    configure django with max_databases sqlite databases in directory,
+    return their aliases
+    """
+    aliases = ["default"] + [f"db{index}" for index in range(1, max_databases)]
+    settings.configure(
+        DATABASES={
+            alias: {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(directory, f"{alias}.sqlite3"),
+            }
+            for alias in aliases
+        },
+        INSTALLED_APPS=["django_multidatabase_queryset"],
+        DEFAULT_AUTO_FIELD="django.db.models.BigAutoField",
+        USE_TZ=True,
+    )
+    django.setup()
+    return aliases
+
+
+def benchmark_model():
+    # pylint: disable=import-outside-toplevel
+    from django.db import models
+
+    from django_multidatabase_queryset.models import MultiDataBaseModel
+
+    class BenchmarkRow(MultiDataBaseModel):
+        score = models.IntegerField()
+        type = models.CharField(max_length=16)
+
+        class Meta:
+            app_label = "django_multidatabase_queryset"
+
+    return BenchmarkRow
+
+
+def load(model, aliases, rows, seed):
+    """
+    create the table in every database and spread rows over them
+    """
+    # pylint: disable=import-outside-toplevel
+    from django.db import connections, transaction
+    randomizer = random.Random(seed)
+    model.DATABASES = aliases
+    for index, alias in enumerate(aliases):
+        connection = connections[alias]
+        with connection.schema_editor() as editor:
+            if model._meta.db_table in connection.introspection.table_names():
+                editor.delete_model(model)
+            editor.create_model(model)
+        pks = iter(range(index + 1, rows + 1, len(aliases)))
+        with transaction.atomic(using=alias):
+            while True:
+                # bulk_create keeps all the objects, load millions in batches
+                batch = [
+                    model(id=pk, score=randomizer.randrange(rows),
+                          type=f"type{pk % 10}")
+                    for pk in itertools.islice(pks, 5000)
+                ]
+                if not batch:
+                    break
+                model.objects.using(alias).bulk_create(batch)
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(model, rows, repeat, seed):
+    """
+    return {benchmark: result} of one loaded case
+    """
+    queryset = model.objects.order_by("score", "id")
+    randomizer = random.Random(seed)
+    get_pks = [randomizer.randrange(1, rows + 1) for _ in range(100)]
+    page = list(queryset[rows // 2:rows // 2 + 1])
+    cursor = queryset.get_cursor(page[0]) if page else None
+
+    def merge():
+        for _ in queryset.all():
+            pass
+
+    def iterator():
+        for _ in queryset.iterator(chunk_size=2000):
+            pass
+
+    def get():
+        for pk in get_pks:
+            model.objects.get(pk=pk)
+
+    cases = {
+        "merge": (merge, rows),
+        "iterator": (iterator, rows),
+        "count": (model.objects.count, 1),
+        "get": (get, len(get_pks)),
+        "first_page": (lambda: list(queryset[:20]), 1),
+        "deep_page": (lambda: list(queryset[rows // 2:rows // 2 + 20]), 1),
+        "after": (lambda: list(queryset.after(cursor, 20)), 1),
+    }
+    results = {}
+    for name, (function, operations) in cases.items():
+        best, median = timed(function, repeat)
+        results[name] = {
+            "seconds": best,
+            "median_seconds": median,
+            "operations_per_second": operations / best if best else None,
+        }
+    results["merge_memory"] = {"peak_bytes": peak_memory(merge)}
+    results["iterator_memory"] = {"peak_bytes": peak_memory(iterator)}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    return the messages of the benchmarks slower than baseline * threshold
+    """
+    def index(report):
+        return {
+            (result["benchmark"], result["databases"], result["rows"]): result
+            for result in report["results"]
+        }
+    old = index(baseline)
+    messages = []
+    for key, result in index(results).items():
+        if key not in old:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if not old[key].get(metric) or metric not in result:
+                continue
+            ratio = result[metric] / old[key][metric]
+            if ratio > threshold:
+                messages.append(
+                    f"{key[0]} with {key[1]} databases and {key[2]} rows: "
+                    f"{metric} {old[key][metric]:.6g} -> {result[metric]:.6g} "
+                    f"({ratio:.2f}x)")
+    return messages
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--databases", type=parse_list, default=[2, 4],
+                        help="comma separated numbers of databases")
+    parser.add_argument("--rows", type=parse_list, default=[10000, 100000],
+                        help="comma separated numbers of rows")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory", default=None,
+                        help="where the sqlite files are created, "
+                        "a temporary directory by default")
+    parser.add_argument("--output", default=None,
+                        help="write the json results to this file")
+    parser.add_argument("--compare", default=None,
+                        help="json results of a previous run")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporary:
+        aliases = configure(args.directory or temporary, max(args.databases))
+        model = benchmark_model()
+        report = {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "repeat": args.repeat,
+            "results": [],
+        }
+        for databases in args.databases:
+            for rows in args.rows:
+                load(model, aliases[:databases], rows, args.seed)
+                results = run_case(model, rows, args.repeat, args.seed)
+                for name in BENCHMARKS:
+                    report["results"].append({
+                        "benchmark": name, "databases": databases,
+                        "rows": rows, **results[name],
+                    })
+                    print(name, databases, rows, json.dumps(results[name]),
+                          file=sys.stderr)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            messages = compare(report, json.load(file), args.threshold)
+        for message in messages:
+            print(f"regression: {message}", file=sys.stderr)
+        return 1 if messages else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
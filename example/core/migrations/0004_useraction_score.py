@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_rename_action_type_useraction_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useraction',
+            name='score',
+            field=models.IntegerField(null=True),
+        ),
+    ]
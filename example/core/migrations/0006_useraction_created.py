@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_useraction_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useraction',
+            name='created',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
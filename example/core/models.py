@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 
 from django_multidatabase_queryset.models import MultiDataBaseModel
@@ -9,6 +10,10 @@ class UserAction(MultiDataBaseModel):
 
     type = models.TextField(default="")
     detail = models.JSONField(default=dict)
+    score = models.IntegerField(null=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(null=True)
 
     def __str__(self):
         return f"{self.pk}: {self.type}"
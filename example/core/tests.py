@@ -1,8 +1,32 @@
 # pylint: disable=missing-class-docstring, missing-function-docstring
+import datetime
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-from django.test import TestCase
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import (
+    IntegrityError, NotSupportedError, OperationalError, connections,
+)
+from django.db import models
+from django.db.models import Avg, Count, Max, Min, StdDev, Sum
+from django.db.models.query import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from core.models import UserAction
+from django_multidatabase_queryset.archive import archive_queryset
+from django_multidatabase_queryset.cache import QueryCache
+from django_multidatabase_queryset.health import mark_healthy, warm_up
+from django_multidatabase_queryset.models import get_default_executor
+from django_multidatabase_queryset.partitions import (
+    HashPartition, ModuloPartition, Partition, PartitionRouter,
+    RangePartition,
+)
+from django_multidatabase_queryset.tracing import Tracer
 
 
 logging.basicConfig(level=logging.INFO)
@@ -10,7 +34,7 @@ LOGGER = logging.getLogger(__name__)
 
 
 class Test(TestCase):
-    databases = ["default", "db_cold"]
+    databases = ("default", "db_cold")
 
     def test_all(self):
         hot_data = UserAction(type="hot")
@@ -90,3 +114,860 @@ class Test(TestCase):
             UserAction.objects.filter(type="hot").get(),
             UserAction.objects.get(type="hot"),
         )
+
+    def test_slice(self):
+        for i in range(10):
+            UserAction(id=i + 1, type=f"type{i}").save(
+                using="default" if i % 3 else "db_cold")
+        order_qs = UserAction.objects.order_by("type", "pk")
+        self.assertEqual(
+            [i.type for i in order_qs[2:5]],
+            ["type2", "type3", "type4"],
+        )
+        self.assertEqual(order_qs[0].type, "type0")
+        self.assertEqual(order_qs[9].type, "type9")
+        self.assertEqual(order_qs[8:][1].type, "type9")
+        self.assertEqual(order_qs[2:5].count(), 3)
+        self.assertEqual(order_qs[8:20].count(), 2)
+        self.assertEqual(len(order_qs[::2]), 5)
+        self.assertEqual(list(order_qs[5:5]), [])
+        self.assertTrue(order_qs[9:].exists())
+        self.assertFalse(order_qs[10:].exists())
+        with self.assertRaises(IndexError):
+            order_qs[10]  # pylint: disable=pointless-statement
+        with self.assertRaises(ValueError):
+            order_qs[-1]  # pylint: disable=pointless-statement
+        with self.assertRaises(TypeError):
+            order_qs[:3].filter(type="type1")
+        with CaptureQueriesContext(connections["db_cold"]) as context:
+            list(order_qs[1:3])
+        self.assertIn("LIMIT 3", context.captured_queries[0]["sql"])
+
+    def test_after(self):
+        for i in range(10):
+            UserAction(id=i + 1, type=f"type{i // 2}").save(
+                using="default" if i % 3 else "db_cold")
+        order_qs = UserAction.objects.order_by("-type")
+        page = list(order_qs.after(limit=3))
+        self.assertEqual([i.pk for i in page], [9, 10, 7])
+        seen = page
+        while page:
+            page = list(order_qs.after(
+                order_qs.get_cursor(page[-1]), limit=3))
+            seen.extend(page)
+        self.assertEqual(
+            [i.pk for i in seen], [9, 10, 7, 8, 5, 6, 3, 4, 1, 2])
+        with CaptureQueriesContext(connections["db_cold"]) as context:
+            list(order_qs.after(order_qs.get_cursor(seen[5]), limit=3))
+        self.assertIn("LIMIT 3", context.captured_queries[0]["sql"])
+        with self.assertRaises(ValueError):
+            order_qs.after("not a cursor", limit=3)
+
+    def test_after_lossless(self):
+        created = datetime.datetime(2023, 1, 1, 12, tzinfo=datetime.timezone.utc)
+        user = get_user_model().objects.create(username="after")
+        for pk, microsecond, db_name in [
+                (1, 123456, "default"), (2, 123400, "db_cold"),
+                (3, 123000, "default"), (4, 123999, "db_cold")]:
+            UserAction(
+                id=pk, user=user if pk % 2 else None,
+                created=created.replace(microsecond=microsecond),
+            ).save(using=db_name)
+        for ordering, expected in [
+                (("-created",), [4, 1, 2, 3]),
+                (("created",), [3, 2, 1, 4]),
+                (("user", "-pk"), [4, 2, 3, 1])]:
+            order_qs = UserAction.objects.order_by(*ordering)
+            seen = []
+            page = list(order_qs.after(limit=1))
+            while page:
+                seen.extend(page)
+                page = list(order_qs.after(
+                    order_qs.get_cursor(page[-1]), limit=1))
+            self.assertEqual([i.pk for i in seen], expected)
+
+    def test_order_null(self):
+        for pk, type_, score, db_name in [
+                (1, "a", 3, "default"), (2, "b", None, "db_cold"),
+                (3, "c", 3, "db_cold"), (4, "d", 1, "default"),
+                (5, "e", None, "default"), (6, "f", 2, "db_cold")]:
+            UserAction(id=pk, type=type_, score=score).save(using=db_name)
+        for ordering, expected in [
+                (("-score", "type"), [1, 3, 6, 4, 2, 5]),
+                (("score", "-type"), [5, 2, 4, 6, 3, 1]),
+                (("-type",), [6, 5, 4, 3, 2, 1])]:
+            order_qs = UserAction.objects.order_by(*ordering)
+            self.assertEqual([i.pk for i in order_qs], expected)
+            page = list(order_qs.after(limit=2))
+            seen = page
+            while page:
+                page = list(order_qs.after(
+                    order_qs.get_cursor(page[-1]), limit=2))
+                seen.extend(page)
+            self.assertEqual([i.pk for i in seen], expected)
+
+    def test_reverse(self):
+        for pk, type_, score, db_name in [
+                (1, "a", 3, "default"), (2, "b", None, "db_cold"),
+                (3, "c", 3, "db_cold"), (4, "d", 1, "default"),
+                (5, "e", None, "default"), (6, "f", 2, "db_cold")]:
+            UserAction(id=pk, type=type_, score=score).save(using=db_name)
+        for ordering, expected in [
+                (("-score", "type"), [5, 2, 4, 6, 3, 1]),
+                (("score", "-type"), [1, 3, 6, 4, 2, 5]),
+                (("score",), [3, 1, 6, 4, 5, 2])]:
+            order_qs = UserAction.objects.order_by(*ordering)
+            self.assertEqual([i.pk for i in order_qs.reverse()], expected)
+            self.assertEqual(order_qs.last().pk, expected[0])
+            self.assertEqual(
+                [i.pk for i in order_qs.reverse().reverse()], expected[::-1])
+        order_qs = UserAction.objects.order_by("score")
+        self.assertEqual(order_qs.order_fields, ("score",))
+        with CaptureQueriesContext(connections["db_cold"]) as context:
+            self.assertEqual(order_qs.latest("score").pk, 3)
+        self.assertIn("DESC", context.captured_queries[0]["sql"])
+        self.assertIn("LIMIT 1", context.captured_queries[0]["sql"])
+        self.assertEqual(order_qs.order_fields, ("score",))
+        self.assertEqual(UserAction.objects.earliest("score", "-id").pk, 5)
+        self.assertEqual(UserAction.objects.last().pk, 6)
+        self.assertIsNone(UserAction.objects.filter(id=0).last())
+        with self.assertRaises(UserAction.DoesNotExist):
+            UserAction.objects.filter(id=0).latest("id")
+        with self.assertRaises(ValueError):
+            UserAction.objects.latest()
+        with self.assertRaises(TypeError):
+            order_qs[:2].reverse()
+        cached = UserAction.objects.order_by("id")
+        list(cached)
+        with self.assertNumQueries(0, using="default"):
+            self.assertEqual(cached.last().pk, 6)
+
+    def test_values(self):
+        for pk, type_, score, db_name in [
+                (1, "a", 3, "default"), (2, "b", None, "db_cold"),
+                (3, "c", 2, "db_cold"), (4, "d", 1, "default")]:
+            UserAction(id=pk, type=type_, score=score).save(using=db_name)
+        order_qs = UserAction.objects.order_by("-score")
+        self.assertEqual(
+            list(order_qs.values("type")),
+            [{"type": "a"}, {"type": "c"}, {"type": "d"}, {"type": "b"}],
+        )
+        self.assertEqual(
+            list(order_qs.values_list("id", "type")[1:3]),
+            [(3, "c"), (4, "d")],
+        )
+        self.assertEqual(
+            list(order_qs.values_list("type", flat=True)),
+            ["a", "c", "d", "b"],
+        )
+        self.assertEqual(
+            list(UserAction.objects.order_by("pk").values_list(
+                "id", flat=True)),
+            [1, 2, 3, 4],
+        )
+        self.assertEqual(
+            [row.type for row in order_qs.values_list("type", named=True)],
+            ["a", "c", "d", "b"],
+        )
+        self.assertEqual(
+            next(order_qs.values("id", "score").iterator(chunk_size=1)),
+            {"id": 1, "score": 3},
+        )
+        with self.assertNumQueries(1, using="default"):
+            data = list(order_qs.only("type"))
+            self.assertEqual([i.pk for i in data], [1, 3, 4, 2])
+            self.assertEqual([i.type for i in data], ["a", "c", "d", "b"])
+        data = list(order_qs.defer("score", "detail"))
+        self.assertEqual(data[0].get_deferred_fields(), {"detail"})
+
+    def test_aggregate(self):
+        for pk, score, db_name in [
+                (1, 3, "default"), (2, None, "db_cold"),
+                (3, 2, "db_cold"), (4, 1, "default")]:
+            UserAction(id=pk, score=score).save(using=db_name)
+        self.assertEqual(
+            UserAction.objects.aggregate(
+                Count("id"), Sum("score"), Min("score"), Max("score"),
+                avg=Avg("score"), count_score=Count("score"),
+            ),
+            {
+                "id__count": 4, "score__sum": 6, "score__min": 1,
+                "score__max": 3, "avg": 2.0, "count_score": 3,
+            },
+        )
+        self.assertEqual(
+            UserAction.objects.filter(pk=2).aggregate(
+                total=Sum("score", default=0), avg=Avg("score")),
+            {"total": 0, "avg": None},
+        )
+        with self.assertRaises(NotSupportedError):
+            UserAction.objects.aggregate(StdDev("score"))
+        with self.assertRaises(NotSupportedError):
+            UserAction.objects.aggregate(Count("score", distinct=True))
+
+    def test_group_by(self):
+        for pk, type_, score, db_name in [
+                (1, "a", 3, "default"), (2, "b", None, "db_cold"),
+                (3, "a", 2, "db_cold"), (4, "c", 1, "default"),
+                (5, "b", 5, "default"), (6, "a", 4, "db_cold")]:
+            UserAction(id=pk, type=type_, score=score).save(using=db_name)
+        group_qs = UserAction.objects.values("type").annotate(
+            n=Count("id"), avg=Avg("score"))
+        self.assertEqual(
+            list(group_qs.order_by("-n", "type")),
+            [
+                {"type": "a", "n": 3, "avg": 3.0},
+                {"type": "b", "n": 2, "avg": 5.0},
+                {"type": "c", "n": 1, "avg": 1.0},
+            ],
+        )
+        self.assertEqual(
+            list(group_qs.order_by("avg").values_list("type", "n")[1:]),
+            [("a", 3), ("b", 2)],
+        )
+        self.assertEqual(
+            list(UserAction.objects.order_by("type").values_list(
+                "type", flat=True).annotate(total=Sum("score"))),
+            ["a", "b", "c"],
+        )
+        self.assertEqual(group_qs.count(), 3)
+        self.assertEqual(group_qs.get(type="b")["n"], 2)
+        with self.assertRaises(NotSupportedError):
+            group_qs.filter(n__gt=1)
+        # every database only returns its groups
+        self.assertEqual(len(group_qs.query_dict["db_cold"]), 2)
+        sql = str(group_qs.query_dict["db_cold"].query)
+        self.assertNotIn("detail", sql)
+
+    async def test_group_by_async(self):
+        for pk, type_, db_name in [
+                (1, "a", "default"), (2, "a", "db_cold"), (3, "b", "db_cold")]:
+            await UserAction(id=pk, type=type_).asave(using=db_name)
+        group_qs = UserAction.objects.values("type").annotate(n=Count("id"))
+        self.assertEqual(await group_qs.aget(type="a"), {"type": "a", "n": 2})
+
+    def test_database_ranges(self):
+        for db_name, pks in (("db_cold", range(1, 4)), ("default", range(4, 7))):
+            for pk in pks:
+                UserAction(id=pk, type=f"type{pk}").save(using=db_name)
+        ranges = {"default": {"pk": (4, None)}, "db_cold": {"id": (None, 4)}}
+        with mock.patch.object(UserAction, "DATABASE_RANGES", ranges):
+            self.assertEqual(
+                list(UserAction.objects.filter(id__gte=5).query_dict),
+                ["default"],
+            )
+            self.assertEqual(
+                list(UserAction.objects.filter(pk__in=[1, 2]).query_dict),
+                ["db_cold"],
+            )
+            self.assertEqual(
+                list(UserAction.objects.filter(
+                    models.Q(id__range=(3, 4)), type="type4").query_dict),
+                ["default", "db_cold"],
+            )
+            self.assertEqual(
+                list(UserAction.objects.filter(
+                    models.Q(id=1) | models.Q(id=6)).query_dict),
+                ["default", "db_cold"],
+            )
+            with self.assertNumQueries(0, using="db_cold"):
+                self.assertEqual(UserAction.objects.get(pk=5).type, "type5")
+                self.assertEqual(
+                    UserAction.objects.filter(id__gte=4).count(), 3)
+            with self.assertNumQueries(0, using="default"):
+                self.assertEqual(
+                    list(UserAction.objects.filter(
+                        id__in=[]).order_by("pk")), [])
+
+    def test_result_cache(self):
+        for pk in range(1, 5):
+            UserAction(id=pk, type=f"type{pk}").save(
+                using="default" if pk % 2 else "db_cold")
+        queryset = UserAction.objects.order_by("-type")
+        with self.assertNumQueries(1, using="default"), \
+                self.assertNumQueries(1, using="db_cold"):
+            self.assertEqual([action.pk for action in queryset], [4, 3, 2, 1])
+            self.assertEqual(len(queryset), 4)
+            self.assertTrue(queryset)
+            self.assertEqual(queryset[1].pk, 3)
+            self.assertEqual([action.pk for action in queryset[1:3]], [3, 2])
+            self.assertEqual(queryset.count(), 4)
+            self.assertTrue(queryset.exists())
+            self.assertEqual(queryset.first().pk, 4)
+            self.assertEqual([action.pk for action in queryset], [4, 3, 2, 1])
+        self.assertFalse(UserAction.objects.filter(type="none"))
+        # iterator() streams without filling the cache
+        other = UserAction.objects.order_by("type")
+        self.assertEqual(len(list(other.iterator())), 4)
+        self.assertIsNone(other._result_cache)  # pylint: disable=protected-access
+        queryset.filter(id=1).update(type="type5")
+        queryset.update(score=1)
+        self.assertEqual(queryset[0].pk, 1)
+
+    def test_lazy_query_dict(self):
+        UserAction(id=1, type="type1").save(using="db_cold")
+        with mock.patch.object(QuerySet, "using",
+                               autospec=True, side_effect=QuerySet.using) as using:
+            queryset = UserAction.objects.filter(type="type1").exclude(
+                id=2).order_by("-id").only("type")[:5]
+            self.assertEqual(using.call_count, 0)
+            self.assertEqual([action.pk for action in queryset], [1])
+            self.assertEqual(using.call_count, 2)
+            # a pruned database is never built
+            with mock.patch.object(UserAction, "DATABASE_RANGES", {
+                    "default": {"id": (10, None)}, "db_cold": {"id": (None, 10)}}):
+                self.assertEqual(
+                    list(UserAction.objects.filter(id=1).query_dict), ["db_cold"])
+            self.assertEqual(using.call_count, 3)
+        self.assertEqual(queryset.databases, ["default", "db_cold"])
+
+    def test_tiers(self):
+        UserAction(id=1, type="hot").save(using="default")
+        UserAction(id=2, type="cold").save(using="db_cold")
+        with mock.patch.object(
+                UserAction, "DATABASE_TIERS", [["default"], ["db_cold"]]), \
+                mock.patch.object(
+                    UserAction, "UNIQUE_ACROSS_DATABASES", ["pk"]):
+            with self.assertNumQueries(0, using="db_cold"):
+                self.assertEqual(UserAction.objects.get(pk=1).type, "hot")
+                self.assertEqual(UserAction.objects.get(id__exact=1).pk, 1)
+                self.assertTrue(UserAction.objects.exists())
+                self.assertEqual(UserAction.objects.first().pk, 1)
+            self.assertEqual(UserAction.objects.get(pk=2).type, "cold")
+            with self.assertRaises(UserAction.DoesNotExist):
+                UserAction.objects.get(pk=3)
+            self.assertEqual(UserAction.objects.filter(pk=2).first().pk, 2)
+        with CaptureQueriesContext(connections["db_cold"]) as context:
+            self.assertEqual(UserAction.objects.order_by("-type").first().pk, 1)
+        self.assertIn("LIMIT 1", context.captured_queries[0]["sql"])
+        self.assertIsNone(UserAction.objects.filter(pk=3).first())
+        with self.assertRaises(UserAction.DoesNotExist):
+            UserAction.objects.get(type="missing")
+        UserAction(id=3, type="hot").save(using="db_cold")
+        with self.assertRaises(UserAction.MultipleObjectsReturned):
+            UserAction.objects.get(type="hot")
+
+    def test_bulk_write(self):
+        ranges = {"default": {"pk": (4, None)}, "db_cold": {"id": (None, 4)}}
+        with mock.patch.object(UserAction, "DATABASE_RANGES", ranges):
+            objs = UserAction.objects.bulk_create(
+                [UserAction(id=pk, type="new") for pk in range(1, 7)],
+                batch_size=2,
+            )
+            self.assertEqual([obj.pk for obj in objs], list(range(1, 7)))
+            self.assertEqual(
+                UserAction.objects.create(id=7, type="new").pk, 7)
+            self.assertEqual(
+                UserAction.objects.using("db_cold").count(), 3)
+            self.assertEqual(
+                UserAction.objects.using("default").count(), 4)
+            # a pk the ranges can not place goes to default
+            self.assertEqual(
+                UserAction(type="new").get_write_database(), "default")
+        self.assertEqual(
+            UserAction.objects.filter(id__in=[3, 4]).update(type="updated"),
+            2,
+        )
+        self.assertEqual(
+            UserAction.objects.filter(type="updated").count(), 2)
+        self.assertEqual(
+            UserAction.objects.filter(id__gte=3).delete(),
+            (5, {"core.UserAction": 5}),
+        )
+        self.assertEqual(UserAction.objects.count(), 2)
+        with self.assertRaises(TypeError):
+            UserAction.objects.order_by("pk")[:1].delete()
+
+    def test_archive(self):
+        UserAction.objects.bulk_create(
+            [UserAction(id=pk, type="old") for pk in range(1, 8)]
+            + [UserAction(id=pk, type="new") for pk in range(8, 11)])
+        # a copy left behind by an interrupted run
+        UserAction(id=1, type="old").save(using="db_cold")
+        result = UserAction.objects.filter(type="old").archive(
+            "default", "db_cold", batch_size=3, max_batches=2)
+        self.assertEqual((result.moved, result.batches, result.last_pk),
+                         (6, 2, 6))
+        result = UserAction.objects.filter(type="old").archive(
+            "default", "db_cold", batch_size=3, start_after=result.last_pk)
+        self.assertEqual((result.moved, result.batches), (1, 1))
+        self.assertEqual(
+            list(UserAction.objects.using("db_cold").order_by(
+                "pk").values_list("pk", flat=True)),
+            list(range(1, 8)),
+        )
+        self.assertEqual(UserAction.objects.using("default").count(), 3)
+        out = StringIO()
+        call_command(
+            "archive_rows", "core.UserAction", "--from", "default",
+            "--to", "db_cold", "--filter", '{"id__gte": 9}', stdout=out)
+        self.assertIn("moved 2 rows in 1 batches", out.getvalue())
+        self.assertEqual(UserAction.objects.using("db_cold").count(), 9)
+        self.assertEqual(UserAction.objects.count(), 10)
+        # a row that stops matching the filter during the copy is kept
+        UserAction.objects.using("default").filter(pk=8).update(type="old")
+        bulk_create = QuerySet.bulk_create
+
+        def update_during_copy(queryset, objs, *args, **kwargs):
+            UserAction.objects.using("default").filter(pk=8).update(
+                type="new")
+            return bulk_create(queryset, objs, *args, **kwargs)
+        with mock.patch.object(QuerySet, "bulk_create", update_during_copy):
+            UserAction.objects.filter(type="old").archive(
+                "default", "db_cold")
+        self.assertEqual(
+            UserAction.objects.using("default").get(pk=8).type, "new")
+        # the autoincrement of every database gives the same pk to
+        # different rows
+        UserAction.objects.all().delete()
+        UserAction(type="hot-row").save(using="default")
+        cold = UserAction(type="cold-row")
+        cold.save(using="db_cold")
+        UserAction.objects.using("default").filter(
+            type="hot-row").update(id=cold.pk)
+        with self.assertRaises(IntegrityError):
+            UserAction.objects.filter(type="hot-row").archive(
+                "default", "db_cold")
+        self.assertEqual(
+            sorted(UserAction.objects.values_list("type", flat=True)),
+            ["cold-row", "hot-row"])
+        # the actions of a user would be left behind
+        with self.assertRaises(ValueError):
+            archive_queryset(
+                get_user_model().objects.using("default"), "db_cold")
+
+    def test_partition(self):
+        partition = ModuloPartition("pk", ["default", "db_cold"])
+        with mock.patch.object(UserAction, "PARTITION", partition):
+            for pk in range(1, 5):
+                UserAction.objects.create(id=pk, type=f"type{pk}")
+            self.assertEqual(
+                sorted(UserAction.objects.using("db_cold").values_list(
+                    "id", flat=True)),
+                [1, 3])
+            with self.assertNumQueries(0, using="default"), \
+                    self.assertNumQueries(1, using="db_cold"):
+                self.assertEqual(UserAction.objects.get(pk=3).type, "type3")
+            with self.assertNumQueries(0, using="db_cold"):
+                self.assertEqual(
+                    sorted(UserAction.objects.filter(
+                        id__in=[2, 4]).values_list("id", flat=True)),
+                    [2, 4])
+            # a lookup the partition can not answer asks every database
+            self.assertEqual(
+                UserAction.objects.filter(pk__gt=2).count(), 2)
+            # the pk the database would assign is not known when routing
+            with self.assertRaises(ValueError):
+                UserAction.objects.create(type="no-pk")
+            with self.assertRaises(ValueError):
+                UserAction.objects.bulk_create([UserAction(type="no-pk")])
+            self.assertFalse(UserAction.objects.filter(type="no-pk").exists())
+            with override_settings(DATABASE_ROUTERS=[
+                    "django_multidatabase_queryset.partitions.PartitionRouter"]):
+                UserAction(id=5, type="type5").save()
+                action = UserAction.objects.using("db_cold").get(id=5)
+                self.assertEqual(action._state.db, "db_cold")
+                with self.assertRaises(ValueError):
+                    UserAction(type="no-pk").save()
+                self.assertEqual(
+                    PartitionRouter().db_for_read(
+                        UserAction, instance=UserAction(id=6)),
+                    "default")
+        with self.assertRaises(TypeError):
+            Partition("pk")  # pylint: disable=abstract-class-instantiated
+        self.assertEqual(
+            HashPartition("type", ["default", "db_cold"]).database("a"),
+            HashPartition("type", ["default", "db_cold"]).database("a"))
+        self.assertEqual(
+            RangePartition("score", {"default": (10, None),
+                                     "db_cold": (None, 10)})
+            .lookup_databases("gte", 20),
+            {"default"})
+
+    def test_degraded(self):
+        self.addCleanup(mark_healthy, "db_cold")
+        UserAction.objects.bulk_create(
+            [UserAction(id=pk, type="hot", score=pk) for pk in range(1, 4)])
+        UserAction.objects.using("db_cold").bulk_create(
+            [UserAction(id=pk, type="cold", score=pk)
+             for pk in range(4, 1004)])
+        with mock.patch.object(UserAction, "STATEMENT_TIMEOUTS",
+                               {"db_cold": 0}):
+            with self.assertRaises(OperationalError):
+                UserAction.objects.filter(score__gte=0).count()
+            queryset = UserAction.objects.degraded().filter(score__gte=0)
+            self.assertEqual(queryset.count(), 3)
+            self.assertEqual(list(queryset.skipped_databases), ["db_cold"])
+            self.assertEqual(
+                [i.pk for i in queryset.order_by("-score")], [3, 2, 1])
+            self.assertEqual(queryset.aggregate(Sum("score")),
+                             {"score__sum": 6})
+            with self.assertRaises(UserAction.DoesNotExist):
+                queryset.get(score=500)
+        # the statement timeout does not outlive the query
+        self.assertEqual(
+            UserAction.objects.filter(score__gte=0).count(), 1003)
+        with mock.patch.object(UserAction, "DEGRADED_RETRY_AFTER", 60):
+            with CaptureQueriesContext(connections["db_cold"]) as cold:
+                queryset = UserAction.objects.degraded()
+                self.assertEqual(len(queryset), 3)
+            self.assertEqual(cold.captured_queries, [])
+            self.assertEqual(list(queryset.skipped_databases), ["db_cold"])
+            # writes are never skipped
+            self.assertEqual(queryset.update(type="both"), 1003)
+            mark_healthy("db_cold")
+            self.assertEqual(UserAction.objects.degraded().count(), 1003)
+            with mock.patch.object(
+                    connections["db_cold"], "ensure_connection",
+                    side_effect=OperationalError("down")):
+                self.assertEqual(
+                    list(warm_up(UserAction)), ["db_cold"])
+            queryset = UserAction.objects.degraded()
+            self.assertEqual(queryset.count(), 3)
+            self.assertIn("db_cold", queryset.skipped_databases)
+            self.assertEqual(warm_up(), {})
+            self.assertEqual(queryset.count(), 1003)
+            self.assertEqual(queryset.skipped_databases, {})
+        # the worker threads own their connections
+        threads = set()
+        with ThreadPoolExecutor(max_workers=2) as executor, mock.patch.object(
+                type(connections["db_cold"]), "ensure_connection",
+                lambda _: threads.add(threading.get_ident())):
+            self.assertEqual(warm_up(UserAction, executor=executor), {})
+        self.assertEqual(len(threads), 3)
+        # every queryset reports the databases its own evaluation skipped
+        base = UserAction.objects.degraded()
+        slow = base.filter(score__gte=0)
+        fast = base.filter(id__lte=3)
+        with mock.patch.object(UserAction, "STATEMENT_TIMEOUTS",
+                               {"db_cold": 0}):
+            self.assertEqual(len(slow), 3)
+            self.assertEqual(fast.skipped_databases, {})
+            self.assertEqual(fast.count(), 3)
+            self.assertEqual(fast.skipped_databases, {})
+            self.assertEqual(list(slow.skipped_databases), ["db_cold"])
+            # the rows are cached, the flag still tells how they were read
+            self.assertEqual(slow.count(), 3)
+            self.assertEqual(list(slow.skipped_databases), ["db_cold"])
+            # get() runs on an internal clone
+            self.assertEqual(slow.get(score=1).pk, 1)
+            self.assertEqual(list(slow.skipped_databases), ["db_cold"])
+            self.assertEqual(slow.order_by("score")[0].pk, 1)
+            self.assertEqual(list(slow.skipped_databases), ["db_cold"])
+        self.assertEqual(slow.filter(id=4).first().pk, 4)
+        self.assertEqual(list(slow.skipped_databases), ["db_cold"])
+        fresh = slow.filter(id=4)
+        self.assertEqual(fresh.first().pk, 4)
+        self.assertEqual(fresh.skipped_databases, {})
+
+    def test_distinct_across_databases(self):
+        for pk in range(1, 7):
+            UserAction(id=pk, type=f"type{pk % 3}", score=pk).save(
+                using="default")
+        # an archive copied 2 and 3 but has not deleted them yet
+        for pk in (2, 3):
+            UserAction(id=pk, type=f"type{pk % 3}", score=pk * 10).save(
+                using="db_cold")
+        self.assertEqual(UserAction.objects.count(), 8)
+        queryset = UserAction.objects.distinct_across_databases()
+        self.assertEqual(queryset.count(), 6)
+        self.assertEqual(queryset[:4].count(), 4)
+        self.assertEqual(
+            [(action.pk, action._state.db)
+             for action in queryset.order_by("pk")],
+            [(1, "default"), (2, "default"), (3, "default"),
+             (4, "default"), (5, "default"), (6, "default")])
+        cold_first = UserAction.objects.distinct_across_databases(
+            precedence=["db_cold"])
+        self.assertEqual(
+            [(action.pk, action.score) for action in cold_first.order_by("pk")],
+            [(1, 1), (2, 20), (3, 30), (4, 4), (5, 5), (6, 6)])
+        self.assertEqual(
+            list(cold_first.order_by("type").values_list("id", flat=True)),
+            [3, 6, 1, 4, 2, 5])
+        self.assertEqual(
+            sorted(cold_first.values_list("id", "score")),
+            [(1, 1), (2, 20), (3, 30), (4, 4), (5, 5), (6, 6)])
+        self.assertEqual(cold_first.get(pk=2).score, 20)
+        with self.assertRaises(UserAction.MultipleObjectsReturned):
+            UserAction.objects.get(pk=2)
+        with self.assertRaises(NotSupportedError):
+            queryset.aggregate(Sum("score"))
+        with self.assertRaises(NotSupportedError):
+            list(queryset.values_list("type"))
+        with self.assertRaises(TypeError):
+            queryset[:4].distinct_across_databases("type")
+        # a LIMIT 4 of default would only return rows of type "dup"
+        for pk in range(7, 11):
+            UserAction(id=pk, type="dup", score=pk).save(using="default")
+        by_type = UserAction.objects.order_by("-pk").distinct_across_databases(
+            "type")
+        self.assertEqual(
+            [action.pk for action in by_type[:4]], [10, 6, 5, 4])
+        self.assertEqual(by_type[:4].count(), 4)
+        self.assertEqual(by_type[1:].count(), 3)
+
+    def test_query_cache(self):
+        UserAction.objects.bulk_create(
+            [UserAction(id=pk, type="cold", score=pk) for pk in range(1, 4)])
+        UserAction.objects.filter(id__lte=2).archive("default", "db_cold")
+        query_cache = QueryCache(timeouts={"db_cold": 60})
+        with mock.patch.object(UserAction, "QUERY_CACHE", query_cache):
+            queryset = UserAction.objects.filter(type="cold")
+            self.assertEqual(queryset.count(), 3)
+            self.assertEqual(len(list(queryset.order_by("id"))), 3)
+            self.assertEqual(queryset.aggregate(Sum("score")),
+                             {"score__sum": 6})
+            with CaptureQueriesContext(connections["db_cold"]) as cold:
+                self.assertEqual(queryset.count(), 3)
+                rows = list(queryset.order_by("id"))
+                self.assertEqual([row.id for row in rows], [1, 2, 3])
+                self.assertEqual(queryset.aggregate(Sum("score")),
+                                 {"score__sum": 6})
+            self.assertEqual(len(cold.captured_queries), 0)
+            # the cached rows are copies
+            rows[0].type = "changed"
+            self.assertEqual(queryset.order_by("id")[0].type, "cold")
+            # writes to the cold database drop its entries
+            UserAction(id=4, type="cold").save(using="db_cold")
+            self.assertEqual(queryset.count(), 4)
+            queryset.filter(id=4).update(score=4)
+            self.assertEqual(queryset.aggregate(Sum("score")),
+                             {"score__sum": 10})
+            queryset.filter(id=4).delete()
+            self.assertEqual(queryset.count(), 3)
+            UserAction.objects.using("db_cold").filter(id=2).update(type="hot")
+            self.assertEqual(queryset.count(), 2)
+            UserAction.objects.using("db_cold").bulk_create(
+                [UserAction(id=5, type="cold")])
+            self.assertEqual(queryset.count(), 3)
+            # the same sql returns other rows
+            self.assertEqual(
+                next(iter(queryset.order_by("id").values("id"))), {"id": 1})
+            self.assertEqual(
+                next(iter(queryset.order_by("id").values_list("id"))), (1,))
+
+    def test_approximate_count(self):
+        UserAction.objects.bulk_create(
+            [UserAction(id=pk, type="cold") for pk in range(1, 6)])
+        UserAction.objects.filter(id__lte=4).archive("default", "db_cold")
+        with connections["db_cold"].cursor() as cursor:
+            cursor.execute("ANALYZE")
+        # rows written without signals are not seen by the approximation
+        QuerySet(model=UserAction, using="db_cold").bulk_create(
+            [UserAction(id=6, type="new")])
+        with mock.patch.object(UserAction, "APPROXIMATE_COUNT_TIMEOUTS",
+                               {"db_cold": 60}):
+            self.assertEqual(UserAction.objects.count(), 6)
+            self.assertEqual(UserAction.objects.count(approximate=True), 5)
+            queryset = UserAction.objects.filter(type="cold")
+            self.assertEqual(queryset.count(approximate=True), 5)
+            QuerySet(model=UserAction, using="db_cold").filter(
+                id=6).update(type="cold")
+            with CaptureQueriesContext(connections["db_cold"]) as cold:
+                self.assertEqual(queryset.count(approximate=True), 5)
+            self.assertEqual(len(cold.captured_queries), 0)
+            # the hot database is always counted exactly
+            UserAction.objects.create(id=7, type="cold")
+            self.assertEqual(queryset.count(approximate=True), 6)
+            with mock.patch.object(UserAction, "APPROXIMATE_COUNT", True):
+                self.assertEqual(queryset.count(), 6)
+                self.assertEqual(queryset.count(approximate=False), 7)
+            # writes through the queryset drop the cached counts
+            queryset.filter(id=1).delete()
+            self.assertEqual(queryset.count(approximate=True), 6)
+
+    def test_related(self):
+        for db_name in UserAction.DATABASES:
+            get_user_model().objects.using(db_name).bulk_create(
+                [get_user_model()(id=pk, username=f"user{pk}")
+                 for pk in (1, 2)])
+        UserAction.objects.bulk_create(
+            [UserAction(id=pk, type="related", user_id=pk % 2 + 1)
+             for pk in range(1, 7)])
+        UserAction.objects.filter(id__lte=3).archive("default", "db_cold")
+        queryset = UserAction.objects.order_by("id")
+        with self.assertNumQueries(2, using="default"), \
+                self.assertNumQueries(2, using="db_cold"):
+            actions = list(queryset.prefetch_related("user"))
+            self.assertEqual(
+                [action.user.username for action in actions],
+                ["user2", "user1"] * 3)
+        self.assertTrue(all(
+            action.user._state.db == action._state.db for action in actions))
+        with self.assertNumQueries(1, using="default"), \
+                self.assertNumQueries(1, using="db_cold"):
+            actions = list(queryset.select_related("user"))
+            self.assertEqual(
+                [action.user.username for action in actions],
+                ["user2", "user1"] * 3)
+        # only the rows left after the merge are prefetched
+        with CaptureQueriesContext(connections["default"]) as default:
+            actions = list(queryset.prefetch_related("user")[:4])
+        self.assertEqual(len(actions), 4)
+        self.assertIn('"auth_user"."id" = 1', default.captured_queries[-1]["sql"])
+        with self.assertNumQueries(2, using="default"):
+            action = queryset.prefetch_related("user").get(id=4)
+            self.assertEqual(action.user.username, "user1")
+        with self.assertNumQueries(1, using="default"):
+            self.assertEqual(
+                list(queryset.prefetch_related("user").prefetch_related(None)
+                     .values_list("id", flat=True)),
+                [1, 2, 3, 4, 5, 6])
+
+    def test_tracer(self):
+        for pk in range(1, 7):
+            UserAction(id=pk, type=f"type{pk}").save(
+                using="default" if pk % 2 else "db_cold")
+        tracer = mock.Mock(spec=Tracer)
+        with mock.patch.object(UserAction, "TRACER", tracer):
+            self.assertEqual(
+                [action.pk for action in UserAction.objects.order_by("type")],
+                list(range(1, 7)))
+            queries = [call.args[0] for call in tracer.query.call_args_list]
+            self.assertEqual(
+                [(event.db_name, event.kind, event.rows) for event in queries],
+                [("default", "rows", 3), ("db_cold", "rows", 3)])
+            self.assertIn("ORDER BY", queries[0].sql)
+            self.assertTrue(all(event.fetch_time >= 0 for event in queries))
+            merge = tracer.merge.call_args.args[0]
+            self.assertEqual((merge.databases, merge.rows),
+                             (["default", "db_cold"], 6))
+            self.assertGreater(merge.comparisons, 0)
+            tracer.reset_mock()
+            self.assertEqual(UserAction.objects.count(), 6)
+            self.assertEqual(
+                [(call.args[0].kind, call.args[0].rows)
+                 for call in tracer.query.call_args_list],
+                [("count", None), ("count", None)])
+            tracer.reset_mock()
+            list(UserAction.objects.order_by("type").iterator(chunk_size=2))
+            self.assertEqual(
+                [(call.args[0].kind, call.args[0].rows)
+                 for call in tracer.query.call_args_list],
+                [("iterator", 3), ("iterator", 3)])
+            self.assertEqual(tracer.merge.call_args.args[0].rows, 6)
+
+    def test_iterator(self):
+        for i in range(10):
+            UserAction(id=i + 1, type=f"type{9 - i}").save(
+                using="default" if i % 3 else "db_cold")
+        order_qs = UserAction.objects.order_by("type")
+        self.assertEqual(
+            [i.pk for i in order_qs.iterator(chunk_size=2)],
+            list(range(10, 0, -1)),
+        )
+        self.assertEqual(
+            [i.pk for i in order_qs[2:4].iterator(chunk_size=2)], [8, 7])
+        self.assertEqual(
+            sorted(i.pk for i in UserAction.objects.iterator()),
+            list(range(1, 11)),
+        )
+        for query in order_qs.query_dict.values():
+            self.assertIsNone(query._result_cache)  # pylint: disable=protected-access
+
+    async def test_async(self):
+        await UserAction(id=1, type="type2").asave(using="default")
+        await UserAction(id=2, type="type1").asave(using="db_cold")
+        await UserAction(id=3, type="type3").asave(using="db_cold")
+        order_qs = UserAction.objects.order_by("type")
+        self.assertEqual(await order_qs.acount(), 3)
+        self.assertEqual(await order_qs[1:].acount(), 2)
+        self.assertTrue(await order_qs.filter(type="type1").aexists())
+        self.assertFalse(await order_qs[3:].aexists())
+        self.assertEqual((await order_qs.aget(type="type3")).pk, 3)
+        self.assertEqual((await order_qs.afirst()).pk, 2)
+        self.assertEqual([i.pk async for i in order_qs], [2, 1, 3])
+        self.assertEqual([i.pk async for i in order_qs[1:]], [1, 3])
+
+
+class ParallelTest(TransactionTestCase):
+    databases = ("default", "db_cold")
+
+    def test_parallel(self):
+        UserAction(id=1, type="type2").save(using="default")
+        UserAction(id=2, type="type1").save(using="db_cold")
+        UserAction(id=3, type="type3").save(using="db_cold")
+        submitted = []
+        executor = get_default_executor()
+
+        class RecordExecutor:
+            # pylint: disable=too-few-public-methods
+            def submit(self, function, db_name, *args):
+                submitted.append(db_name)
+                return executor.submit(function, db_name, *args)
+
+        parallel_qs = UserAction.objects.parallel(RecordExecutor())
+        self.assertEqual(parallel_qs.count(), 3)
+        self.assertTrue(parallel_qs.filter(type="type1").exists())
+        self.assertFalse(parallel_qs.filter(type="type4").exists())
+        self.assertEqual(parallel_qs.get(type="type3").pk, 3)
+        self.assertEqual(
+            [i.pk for i in parallel_qs.order_by("type")], [2, 1, 3])
+        self.assertEqual(
+            sorted(i.pk for i in parallel_qs.all()), [1, 2, 3])
+        self.assertEqual(len(submitted), 12)
+        self.assertEqual(UserAction.objects.parallel().count(), 3)
+
+    async def test_async_concurrent(self):
+        await UserAction(id=1, type="type2").asave(using="default")
+        await UserAction(id=2, type="type1").asave(using="db_cold")
+        order_qs = UserAction.objects.order_by("type")
+        self.assertEqual(await order_qs.acount(), 2)
+        self.assertEqual([i.pk async for i in order_qs], [2, 1])
+        self.assertEqual(
+            sorted([i.pk async for i in UserAction.objects.all()]), [1, 2])
+
+
+class UnionTest(TransactionTestCase):
+    databases = ("default", "db_cold")
+
+    def setUp(self):
+        with connections["default"].cursor() as cursor:
+            cursor.execute(
+                "ATTACH DATABASE %s AS cold",
+                [connections["db_cold"].settings_dict["NAME"]])
+
+    def tearDown(self):
+        with connections["default"].cursor() as cursor:
+            cursor.execute("DETACH DATABASE cold")
+
+    def test_union(self):
+        for pk in range(1, 11):
+            UserAction(id=pk, type=f"type{pk % 4}", score=pk).save(
+                using="default" if pk % 3 else "db_cold")
+        with mock.patch.object(UserAction, "UNION_DATABASES",
+                               {"db_cold": ("default", "cold")}):
+            queryset = UserAction.objects.order_by("type", "-id")
+            with self.assertNumQueries(0, using="db_cold"), \
+                    CaptureQueriesContext(connections["default"]) as default:
+                actions = list(queryset[2:5])
+                self.assertEqual(queryset.count(), 10)
+                self.assertEqual(
+                    queryset.aggregate(Sum("score"), Max("score")),
+                    {"score__sum": 55, "score__max": 10})
+                self.assertEqual(
+                    list(queryset.values_list("id", flat=True)[:3]),
+                    [8, 4, 9])
+            self.assertEqual(len(default.captured_queries), 4)
+            self.assertIn("UNION ALL", default.captured_queries[0]["sql"])
+            # the UNION ALL breaks ties by pk like the merge
+            self.assertEqual(
+                [action.pk for action in UserAction.objects.order_by("type")],
+                [4, 8, 1, 5, 9, 2, 6, 10, 3, 7])
+            self.assertEqual(
+                list(UserAction.objects.order_by("-type").values_list(
+                    "type", "id")[:3]),
+                [("type3", 3), ("type3", 7), ("type2", 2)])
+            self.assertIn("LIMIT 5", default.captured_queries[0]["sql"])
+            self.assertEqual(
+                [(action.pk, action._state.db) for action in actions],
+                [(9, "db_cold"), (5, "default"), (1, "default")])
+            self.assertEqual(
+                [action._state.db for action in queryset.filter(id__in=[3, 6])],
+                ["db_cold", "db_cold"])
+            action = UserAction.objects.filter(id=3).first()
+            action.score = 30
+            action.save()
+            self.assertEqual(
+                UserAction.objects.using("db_cold").get(id=3).score, 30)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example.settings')
 
 application = get_wsgi_application()
+
+# connect to every database before the first request needs it
+from django_multidatabase_queryset.health import warm_up  # noqa: E402
+
+warm_up()
@@ -0,0 +1,68 @@
+"""
+split aggregates into per database partial aggregates and combine them
+"""
+
+
+import functools
+import operator
+
+from django.db import NotSupportedError
+from django.db.models import Avg, Count, Max, Min, Sum, Value
+
+
+def partial_aggregates(alias, aggregate):
+    """
+    return {name: aggregate} that every database should compute for alias
+    """
+    if isinstance(aggregate, Avg) and not aggregate.distinct:
+        return {
+            f"{alias}_multidb_sum": Sum(
+                *aggregate.source_expressions, filter=aggregate.filter),
+            f"{alias}_multidb_count": Count(
+                *aggregate.source_expressions, filter=aggregate.filter),
+        }
+    if isinstance(aggregate, (Min, Max)) or (
+            isinstance(aggregate, (Count, Sum)) and not aggregate.distinct):
+        partial = aggregate.copy()
+        # the default is applied once after all the databases are combined
+        partial.default = None
+        return {alias: partial}
+    msg = (
+        f"{aggregate!r} can not be combined across databases, "
+        "only Count, Sum, Min, Max and Avg without distinct are supported."
+    )
+    raise NotSupportedError(msg)
+
+
+def combine_aggregate(alias, aggregate, results):
+    """
+    combine the partial aggregates of alias from the result of every database
+    """
+    if isinstance(aggregate, Avg):
+        total = _combine(
+            operator.add,
+            [result[f"{alias}_multidb_sum"] for result in results])
+        count = sum(result[f"{alias}_multidb_count"] for result in results)
+        value = total / count if count else None
+    elif isinstance(aggregate, (Count, Sum)):
+        value = _combine(operator.add, [result[alias] for result in results])
+    elif isinstance(aggregate, Min):
+        value = _combine(min, [result[alias] for result in results])
+    else:
+        value = _combine(max, [result[alias] for result in results])
+    if value is None and aggregate.default is not None:
+        default = aggregate.default
+        if isinstance(default, Value):
+            default = default.value
+        elif hasattr(default, "resolve_expression"):
+            msg = "Only constant defaults can be combined across databases."
+            raise NotSupportedError(msg)
+        value = default
+    return value
+
+
+def _combine(function, values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return functools.reduce(function, values)
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class DjangoMultidatabaseQuerysetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'django_multidatabase_queryset'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel
+        from django_multidatabase_queryset.cache import invalidate_instance  # noqa: PLC0415
+        from django_multidatabase_queryset.counts import invalidate_counts  # noqa: PLC0415
+        post_save.connect(
+            invalidate_instance,
+            dispatch_uid="django_multidatabase_queryset_save")
+        post_delete.connect(
+            invalidate_instance,
+            dispatch_uid="django_multidatabase_queryset_delete")
+        post_save.connect(
+            invalidate_counts,
+            dispatch_uid="django_multidatabase_queryset_save_counts")
+        post_delete.connect(
+            invalidate_counts,
+            dispatch_uid="django_multidatabase_queryset_delete_counts")
@@ -0,0 +1,102 @@
+"""
+move rows from one database to another, e.g. from the hot database to the
+cold database, keeping their pk
+"""
+
+
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models.query import QuerySet
+
+
+@dataclass
+class ArchiveResult:
+    """
+    progress of an archive, pass last_pk as start_after to resume
+    """
+    moved: int = 0
+    batches: int = 0
+    last_pk: Any = None
+
+
+def _values(row):
+    return [getattr(row, field.attname) for field in row._meta.concrete_fields]
+
+
+def archive_queryset(queryset: QuerySet, target: str, *,
+                     batch_size: int = 1000,
+                     sleep: float = 0,
+                     max_batches: Optional[int] = None,
+                     start_after: Any = None,
+                     callback: Optional[Callable[[ArchiveResult], None]] = None,
+                     ) -> ArchiveResult:
+    """
+    move the rows of queryset to the target database in batches ordered by pk
+
+    every batch is locked with select_for_update() in a transaction of the
+    source database, copied to target in another transaction, then deleted
+    by the source transaction, so a write to the rows waits until they are
+    archived. If a run stops between the two commits, the rows already
+    copied are not inserted again on the next run, so the archive can
+    always be resumed by running it again. A different row with the same
+    pk in target raises IntegrityError and the batch stays in the source
+    database
+
+    the rows are deleted without the deletion collector, so a model that
+    other rows refer to can not be archived
+    """
+    if batch_size <= 0:
+        msg = "batch_size must be positive."
+        raise ValueError(msg)
+    model = queryset.model
+    source = queryset.db
+    if source == target:
+        msg = "The source and target database must be different."
+        raise ValueError(msg)
+    if model._meta.related_objects or model._meta.many_to_many:
+        msg = (
+            f"Cannot archive {model._meta.label}, the rows related to it "
+            "would be left behind in the source database."
+        )
+        raise ValueError(msg)
+    queryset = queryset.order_by("pk")
+    target_queryset = QuerySet(model=model, using=target)
+    result = ArchiveResult(last_pk=start_after)
+    while max_batches is None or result.batches < max_batches:
+        batch_queryset = queryset
+        if result.last_pk is not None:
+            batch_queryset = queryset.filter(pk__gt=result.last_pk)
+        with transaction.atomic(using=source):
+            # the rows can not change between their copy and their delete
+            rows = list(batch_queryset.select_for_update()[:batch_size])
+            if not rows:
+                break
+            pks = [row.pk for row in rows]
+            with transaction.atomic(using=target):
+                copied = {
+                    row.pk: row
+                    for row in target_queryset.filter(pk__in=pks)
+                }
+                for row in rows:
+                    if row.pk in copied and _values(row) != _values(copied[row.pk]):
+                        msg = (
+                            f"{model._meta.label} pk={row.pk!r} of {source} "
+                            f"is another row in {target}."
+                        )
+                        raise IntegrityError(msg)
+                target_queryset.bulk_create(
+                    [row for row in rows if row.pk not in copied])
+            # the rows are in target, only their copy in source is deleted,
+            # the collector would cascade and send a signal per row
+            queryset.filter(pk__in=pks)._raw_delete(using=source)
+        result.moved += len(rows)
+        result.batches += 1
+        result.last_pk = pks[-1]
+        if callback is not None:
+            callback(result)
+        if sleep:
+            time.sleep(sleep)
+    return result
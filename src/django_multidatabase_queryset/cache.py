@@ -0,0 +1,113 @@
+"""
+cache the results of the per database queries of MultiQueryset
+
+    class UserAction(MultiDataBaseModel):
+        DATABASES = ["default", "db_cold"]
+        QUERY_CACHE = QueryCache(maxsize=1024, timeouts={"db_cold": 3600})
+"""
+
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.exceptions import EmptyResultSet
+from django.db import models
+
+from django_multidatabase_queryset.union import written_databases
+
+
+class QueryCache:
+    """
+    LRU cache keyed by the compiled sql and params of every per database
+    query, timeouts are seconds by database, databases without a timeout
+    are never cached
+    """
+
+    def __init__(self, maxsize=1024, timeouts=None):
+        self.maxsize = maxsize
+        self.timeouts = timeouts or {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, db_name, kind, query):
+        """
+        return the cache key of running kind on query,
+        None if the query should not be cached
+        """
+        if not self.timeouts.get(db_name):
+            return None
+        try:
+            sql, params = query.query.get_compiler(using=db_name).as_sql()
+        except EmptyResultSet:
+            return None
+        # values() and values_list() of the same columns run the same sql
+        key = (db_name, kind, sql, tuple(params),
+               query._iterable_class, query._fields)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        """
+        return (True, value) for a fresh entry, otherwise (False, None)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+        return True, _copy_result(value)
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.timeouts[key[0]]
+        with self._lock:
+            self._entries[key] = (expires, _copy_result(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, db_name=None):
+        """
+        drop the entries of db_name, or all the entries
+        """
+        with self._lock:
+            if db_name is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == db_name]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _copy_result(value):
+    """
+    callers may change the rows they get, keep the cached ones untouched
+    """
+    if isinstance(value, list):
+        return [
+            copy.copy(row) if isinstance(row, (models.Model, dict)) else row
+            for row in value
+        ]
+    return copy.copy(value) if isinstance(value, dict) else value
+
+
+def invalidate_instance(sender, instance=None, using=None, **kwargs):  # noqa: ARG001
+    # pylint: disable=unused-argument
+    """
+    receiver of post_save and post_delete, drop the cache of the database
+    the instance was written to
+    """
+    query_cache = getattr(sender, "QUERY_CACHE", None)
+    if query_cache is not None:
+        for db_name in written_databases(sender, using):
+            query_cache.invalidate(db_name)
@@ -0,0 +1,117 @@
+"""
+approximate counts of the static databases of a MultiDataBaseModel
+
+    class UserAction(MultiDataBaseModel):
+        DATABASES = ["default", "db_cold"]
+        APPROXIMATE_COUNT_TIMEOUTS = {"db_cold": 3600}
+
+count(approximate=True) reads the row count of an unfiltered table from the
+statistics of the database, otherwise it runs an exact count and keeps it
+for the seconds of the timeout. The databases without a timeout are always
+counted exactly.
+"""
+
+
+import re
+import threading
+
+from django.db import DatabaseError, connections
+
+from django_multidatabase_queryset.cache import QueryCache
+from django_multidatabase_queryset.union import written_databases
+
+_COUNT_CACHES = {}
+_COUNT_CACHES_LOCK = threading.Lock()
+
+
+def count_cache(model):
+    """
+    return the QueryCache of the exact counts of model
+    """
+    with _COUNT_CACHES_LOCK:
+        cache = _COUNT_CACHES.get(model)
+        if cache is None:
+            cache = _COUNT_CACHES[model] = QueryCache()
+    cache.timeouts = model.APPROXIMATE_COUNT_TIMEOUTS
+    return cache
+
+
+def approximate_count(db_name, query):
+    """
+    return the table statistics count of an unfiltered query,
+    otherwise an exact count cached by count_cache
+    """
+    if _is_whole_table(query.query):
+        count = table_statistics_count(db_name, query.model._meta.db_table)
+        if count is not None:
+            return count
+    cache = count_cache(query.model)
+    key = cache.key(db_name, "count", query)
+    if key is None:
+        return query.count()
+    hit, count = cache.get(key)
+    if not hit:
+        count = query.count()
+        cache.set(key, count)
+    return count
+
+
+def _is_whole_table(query):
+    return not (query.where or query.distinct or query.combinator
+                or query.group_by)
+
+
+def table_statistics_count(db_name, table):
+    """
+    return the number of rows of table the database estimated when it was
+    last analyzed, None if the backend has no statistics for it
+    """
+    connection = connections[db_name]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                    [connection.ops.quote_name(table)])
+                row = cursor.fetchone()
+                # -1 means the table was never analyzed
+                if row is None or row[0] is None or row[0] < 0:
+                    return None
+                return int(row[0])
+            if connection.vendor == "mysql":
+                cursor.execute(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    [table])
+                row = cursor.fetchone()
+                return None if row is None or row[0] is None else int(row[0])
+            if connection.vendor == "sqlite":
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master "
+                    "WHERE type = 'table' AND name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                cursor.execute(
+                    "SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+                # the first number of every stat is the rows of the table
+                counts = [
+                    int(match.group())
+                    for stat, in cursor.fetchall()
+                    for match in [re.match(r"\d+", stat or "")] if match
+                ]
+                return max(counts) if counts else None
+    except DatabaseError:
+        return None
+    return None
+
+
+def invalidate_counts(sender, instance=None, using=None, **kwargs):  # noqa: ARG001
+    # pylint: disable=unused-argument
+    """
+    receiver of post_save and post_delete, drop the cached exact counts of
+    the database the instance was written to
+    """
+    cache = _COUNT_CACHES.get(sender)
+    if cache is not None:
+        for db_name in written_databases(sender, using):
+            cache.invalidate(db_name)
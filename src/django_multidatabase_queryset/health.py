@@ -0,0 +1,240 @@
+"""
+bound the time a slow database adds to every query of a MultiDataBaseModel
+
+    class UserAction(MultiDataBaseModel):
+        DATABASES = ["default", "db_cold"]
+        STATEMENT_TIMEOUTS = {"db_cold": 0.5}
+        DEGRADED_RETRY_AFTER = 30
+
+a read of db_cold is cancelled by the database after 0.5 seconds. A degraded
+queryset returns the rows of the databases that answered and keeps the
+errors of the others in skipped_databases, a database that failed is not
+asked again for DEGRADED_RETRY_AFTER seconds
+
+    actions = UserAction.objects.degraded()
+    actions.count()
+    actions.skipped_databases  # {"db_cold": OperationalError(...)}
+
+call warm_up() when a process starts, e.g. in wsgi.py, to open the
+connections of every database before the first request needs them, the
+connections belong to the calling thread, so it does not help the
+requests of an ASGI server
+"""
+
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db import DatabaseError, connections, transaction
+
+LOGGER = logging.getLogger("django_multidatabase_queryset")
+
+# {db_name: (time.monotonic() of the failure, error)}
+_FAILURES = {}
+_FAILURES_LOCK = threading.Lock()
+
+
+class Skipped:
+    """
+    the result of a database a degraded query could not read
+    """
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def mark_failed(db_name, error):
+    with _FAILURES_LOCK:
+        _FAILURES[db_name] = (time.monotonic(), error)
+
+
+def mark_healthy(db_name):
+    with _FAILURES_LOCK:
+        _FAILURES.pop(db_name, None)
+
+
+def failed_databases(db_names, seconds):
+    """
+    return {db_name: error} of the databases that failed less than
+    seconds ago
+    """
+    if not seconds or not _FAILURES:
+        return {}
+    now = time.monotonic()
+    result = {}
+    with _FAILURES_LOCK:
+        for db_name in db_names:
+            failure = _FAILURES.get(db_name)
+            if failure is not None and now - failure[0] < seconds:
+                result[db_name] = failure[1]
+    return result
+
+
+@contextmanager
+def statement_timeout(db_name, seconds):
+    """
+    cancel the statements of db_name that run longer than seconds,
+    nothing is cancelled on the backends without a statement timeout
+
+    the timeout is set once per connection and stays set, so the other
+    statements of the connection are bounded too. Inside a transaction
+    postgresql only sets it for the transaction. On sqlite the progress
+    handler of the connection is replaced the first time it is timed
+    """
+    connection = connections[db_name]
+    connection.ensure_connection()
+    if connection.vendor == "sqlite":
+        with _sqlite_timeout(connection, seconds):
+            yield
+        return
+    if connection.vendor == "oracle":
+        # a client side timeout, setting it costs no round trip
+        previous = connection.connection.call_timeout
+        connection.connection.call_timeout = int(seconds * 1000)
+        try:
+            yield
+        finally:
+            connection.connection.call_timeout = previous
+        return
+    if connection.vendor == "postgresql":
+        value = str(int(seconds * 1000))
+        local = connection.in_atomic_block
+        sql = "SELECT set_config('statement_timeout', %s, {})".format(
+            "true" if local else "false")
+    elif connection.vendor == "mysql":
+        local = False
+        if connection.mysql_is_mariadb:
+            variable, value = "max_statement_time", float(seconds)
+        else:
+            variable, value = "max_execution_time", int(seconds * 1000)
+        sql = f"SET SESSION {variable} = %s"
+    else:
+        yield
+        return
+    # (raw connection, value) of the session timeout already set
+    state = getattr(connection, "_multidb_statement_timeout", None)
+    if (state is None or state[0] is not connection.connection
+            or state[1] != value):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value])
+        # a local setting is undone with its transaction
+        connection._multidb_statement_timeout = (
+            None if local else (connection.connection, value))
+    yield
+
+
+@contextmanager
+def _sqlite_timeout(connection, seconds):
+    # [raw connection, deadline], the handler is installed once per raw
+    # connection and never interrupts between the timed statements
+    state = getattr(connection, "_multidb_deadline", None)
+    if state is None or state[0] is not connection.connection:
+        state = [connection.connection, None]
+        connection._multidb_deadline = state
+        # a true return of the handler interrupts the running statement
+        connection.connection.set_progress_handler(
+            lambda: state[1] is not None and time.monotonic() > state[1],
+            1000)
+    previous = state[1]
+    state[1] = time.monotonic() + seconds
+    try:
+        yield
+    finally:
+        state[1] = previous
+
+
+def timed_function(timeouts, function):
+    """
+    wrap function(db_name, query) with the statement timeout of its
+    database in timeouts
+    """
+    if not timeouts:
+        return function
+
+    def timed(db_name, query):
+        seconds = timeouts.get(db_name)
+        if seconds is None:
+            return function(db_name, query)
+        with statement_timeout(db_name, seconds):
+            return function(db_name, query)
+    return timed
+
+
+def skipping_function(function):
+    """
+    wrap function(db_name, query) to return Skipped instead of raising
+    the DatabaseError of its database
+    """
+    def skipping(db_name, query):
+        try:
+            if connections[db_name].in_atomic_block:
+                # a savepoint keeps the transaction usable after the error
+                with transaction.atomic(using=db_name):
+                    result = function(db_name, query)
+            else:
+                result = function(db_name, query)
+        except DatabaseError as exc:
+            mark_failed(db_name, exc)
+            return Skipped(exc)
+        mark_healthy(db_name)
+        return result
+    return skipping
+
+
+def warm_up(*models, executor=None):
+    """
+    connect to every database of models, of every MultiDataBaseModel when
+    no model is given, return {db_name: error} of the databases that could
+    not be connected, degraded queries skip them like a failed query
+
+    the connections belong to the calling thread, the worker threads of
+    executor, the shared thread pool if a model has PARALLEL_QUERY, are
+    connected too, they keep their connections only when CONN_MAX_AGE is
+    not 0
+    """
+    # pylint: disable=import-outside-toplevel
+    from django_multidatabase_queryset.models import MultiDataBaseModel, get_default_executor  # noqa: PLC0415
+    if not models:
+        models = [
+            model for model in apps.get_models()
+            if issubclass(model, MultiDataBaseModel)
+        ]
+    if executor is None and any(model.PARALLEL_QUERY for model in models):
+        executor = get_default_executor()
+    db_names = list(dict.fromkeys(
+        db_name for model in models for db_name in model.DATABASES))
+    errors = _connect(db_names)
+    if executor is not None:
+        workers = getattr(executor, "_max_workers", 1)
+        # every worker waits for the others, so each one connects once
+        barrier = threading.Barrier(workers)
+        futures = [
+            executor.submit(_connect, db_names, barrier)
+            for _ in range(workers)
+        ]
+        for future in futures:
+            errors.update(future.result())
+    return errors
+
+
+def _connect(db_names, barrier=None):
+    if barrier is not None:
+        try:
+            barrier.wait(timeout=10)
+        except threading.BrokenBarrierError:
+            pass
+    errors = {}
+    for db_name in db_names:
+        try:
+            connections[db_name].ensure_connection()
+        except DatabaseError as exc:
+            LOGGER.warning("cannot connect to %s: %s", db_name, exc)
+            mark_failed(db_name, exc)
+            errors[db_name] = exc
+        else:
+            mark_healthy(db_name)
+    return errors
@@ -0,0 +1,74 @@
+"""
+move the rows of a MultiDataBaseModel from one database to another
+
+    python manage.py archive_rows core.UserAction --from default --to db_cold \
+        --filter '{"created__lt": "2023-01-01"}' --batch-size 1000 --sleep 0.5
+"""
+
+
+import json
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from django_multidatabase_queryset.models import MultiDataBaseModel
+
+
+class Command(BaseCommand):
+    help = "move the rows matching a filter from one database to another"
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="app_label.ModelName")
+        parser.add_argument("--from", dest="source", required=True)
+        parser.add_argument("--to", dest="target", required=True)
+        parser.add_argument(
+            "--filter", default="{}",
+            help="json of the queryset.filter keyword arguments")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--sleep", type=float, default=0,
+            help="seconds to wait between batches")
+        parser.add_argument("--max-batches", type=int, default=None)
+        parser.add_argument(
+            "--start-after", default=None,
+            help="only move rows whose pk is greater, to resume a run")
+
+    def handle(self, *args, **options):  # noqa: ARG002
+        try:
+            model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc)) from exc
+        if not issubclass(model, MultiDataBaseModel):
+            msg = f"{model._meta.label} is not a MultiDataBaseModel."
+            raise CommandError(msg)
+        try:
+            filters = json.loads(options["filter"])
+        except ValueError as exc:
+            msg = f"--filter is not valid json: {exc}"
+            raise CommandError(msg) from exc
+        if not isinstance(filters, dict):
+            msg = "--filter must be a json object."
+            raise CommandError(msg)
+        start_after = options["start_after"]
+        if start_after is not None:
+            start_after = model._meta.pk.to_python(start_after)
+
+        def report(result):
+            self.stdout.write(
+                f"batch {result.batches}: moved {result.moved} rows, "
+                f"last pk {result.last_pk}")
+
+        try:
+            result = model.objects.filter(**filters).archive(
+                options["source"], options["target"],
+                batch_size=options["batch_size"],
+                sleep=options["sleep"],
+                max_batches=options["max_batches"],
+                start_after=start_after,
+                callback=report if options["verbosity"] > 1 else None,
+            )
+        except (TypeError, ValueError) as exc:
+            raise CommandError(str(exc)) from exc
+        self.stdout.write(
+            f"moved {result.moved} rows in {result.batches} batches, "
+            f"last pk {result.last_pk}")
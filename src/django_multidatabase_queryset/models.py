@@ -3,40 +3,195 @@ queryset support multi database
 """
 
 
+import asyncio
+import base64
+import contextvars
+import functools
 import heapq
-
+import itertools
+import json
+import operator
+import time
 from collections import OrderedDict
-from dataclasses import dataclass
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import ClassVar
 
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import NotSupportedError, connections, models
+from django.db.models.constants import LOOKUP_SEP
 from django.db.models.manager import BaseManager
 from django.db.models.query import QuerySet
+from django.db.models.utils import create_namedtuple_class
+
+from django_multidatabase_queryset.aggregates import combine_aggregate, partial_aggregates
+from django_multidatabase_queryset.archive import ArchiveResult, archive_queryset
+from django_multidatabase_queryset.counts import approximate_count, invalidate_counts
+from django_multidatabase_queryset.health import (
+    LOGGER,
+    Skipped,
+    failed_databases,
+    skipping_function,
+    timed_function,
+)
+from django_multidatabase_queryset.partitions import instance_database
+from django_multidatabase_queryset.ranges import (
+    database_ranges,
+    instance_in_ranges,
+    lookup_conditions,
+    may_contain,
+)
+from django_multidatabase_queryset.tracing import (
+    MergeEvent,
+    traced_function,
+    traced_iterator,
+    traced_merge,
+)
+from django_multidatabase_queryset.union import union_aggregates, union_query_dict, written_databases
+
+_EMPTY = object()
+# the skipped_databases of the degraded queryset being evaluated, the
+# querysets it runs internally report their skipped databases to it
+_SKIPPED = contextvars.ContextVar("skipped_databases", default=None)
+
+
+@functools.lru_cache(maxsize=None)
+def get_default_executor():
+    """
+    the thread pool shared by all the MultiQueryset in parallel mode
+    """
+    return ThreadPoolExecutor(thread_name_prefix="multidatabase")
 
 
-@dataclass
-class CompatableObject:
+def _run_with_connection(db_name, function, query):
     """
-    use order_by fields to compare two model instance
+    run in a worker thread which owns its own django connection,
+    release the connection afterwards like django does after a request
     """
-    db_name: str
-    order_by: List[str]
-    instance: models.Model
+    try:
+        return function(db_name, query)
+    finally:
+        connections[db_name].close_if_unusable_or_obsolete()
+
+
+def _first_row(db_name, query):  # pylint: disable=unused-argument  # noqa: ARG001
+    iter_obj = iter(query)
+    return iter_obj, next(iter_obj, _EMPTY)
+
+
+def _fetch_rows(db_name, query):  # pylint: disable=unused-argument  # noqa: ARG001
+    return list(query)
+
+
+def _first_rows(db_name, query):  # pylint: disable=unused-argument  # noqa: ARG001
+    return list(query[:1])
+
+
+_NUMERIC_FIELDS = {
+    "AutoField", "BigAutoField", "SmallAutoField",
+    "IntegerField", "BigIntegerField", "SmallIntegerField",
+    "PositiveIntegerField", "PositiveBigIntegerField",
+    "PositiveSmallIntegerField", "FloatField", "DecimalField",
+}
+
+
+class _Descending:
+    """
+    reverse the comparison of a value which can not be negated
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
 
     def __lt__(self, other):
-        for field in self.order_by:
-            if field.startswith("-"):
-                first_value = getattr(other.instance, field[1:])
-                second_value = getattr(self.instance, field[1:])
-            else:
-                first_value = getattr(self.instance, field)
-                second_value = getattr(other.instance, field)
-            if first_value is None:
-                if second_value is None:
-                    continue
-                return True
-            return first_value < second_value
-        return self.instance.pk < other.instance.pk
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    __hash__ = None
+
+
+def _value_transform(descending, numeric, nullable, null_last):
+    """
+    return a function that maps a value to its part of the sort key,
+    or None if the value can be used as it is
+    """
+    if not descending:
+        transform = None
+    elif numeric:
+        transform = operator.neg
+    else:
+        transform = _Descending
+    if not nullable:
+        return transform
+    null_key = (1,) if null_last else (0,)
+    value_flag = 0 if null_last else 1
+    if transform is None:
+        return lambda value: null_key if value is None else (value_flag, value)
+    return lambda value: (
+        null_key if value is None else (value_flag, transform(value)))
+
+
+def _records_skipped(method):
+    """
+    the skipped_databases of a degraded queryset tell the databases the
+    last evaluation of the method skipped
+    """
+    if asyncio.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            with self._recording():
+                return await method(self, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._recording():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _invalidate_databases(model, db_names):
+    """
+    drop the cached results and counts of the databases written to
+    """
+    query_cache = model.QUERY_CACHE
+    for written in db_names:
+        if query_cache is not None:
+            for db_name in written_databases(model, written):
+                query_cache.invalidate(db_name)
+        invalidate_counts(model, using=written)
+
+
+class DatabaseQuerySet(QuerySet):
+    """
+    the QuerySet of one database, e.g. MultiQueryset.using(), its bulk
+    writes send no signal so they drop the cached results themselves
+    """
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        _invalidate_databases(self.model, [self.db])
+        return rows
+
+    def bulk_create(self, *args, **kwargs):
+        objs = super().bulk_create(*args, **kwargs)
+        _invalidate_databases(self.model, [self.db])
+        return objs
+
+    def bulk_update(self, *args, **kwargs):
+        rows = super().bulk_update(*args, **kwargs)
+        _invalidate_databases(self.model, [self.db])
+        return rows
+
+    def delete(self):
+        result = super().delete()
+        _invalidate_databases(self.model, [self.db])
+        return result
 
 
 class MultiQueryset:
@@ -50,69 +205,893 @@ class MultiQueryset:
     def __init__(self, model,
                  *args,
                  order_fields=None,
+                 executor=None,
                  **kwargs):
         super().__init__(*args, **kwargs)
         self.model = model
-        self.query_dict = OrderedDict()
+        # the django QuerySet every database runs, chained once however
+        # many databases there are, see query_dict
+        self._template = None
+        self._databases = []
+        self._query_dict = None
+        # the merged rows, filled the first time the queryset is iterated
+        self._result_cache = None
         self.order_fields = order_fields or []
+        self.executor = executor
+        self.iterable = "model"
+        # the columns of values() when aggregates are annotated after it
+        self.group_by = None
+        self.group_aggregates = {}
+        # the columns of values() called after the aggregates
+        self.group_select = None
+        self.low_mark = 0
+        self.high_mark = None
+        # prefetched after the merge, once per database
+        self.prefetch_lookups = ()
+        # the fields a row is unique by across the databases
+        self.distinct_fields = None
+        # {db_name: error} of the databases a degraded queryset skipped,
+        # None unless the queryset is degraded, see degraded()
+        self.skipped_databases = None
+
+    @property
+    def template(self):
+        return self._template
+
+    @template.setter
+    def template(self, value):
+        self._template = value
+        self._query_dict = None
+
+    @property
+    def databases(self):
+        """
+        the databases left after pruning, in the order they are merged
+        """
+        return self._databases
+
+    @databases.setter
+    def databases(self, value):
+        self._databases = list(value)
+        self._query_dict = None
+
+    @property
+    def query_dict(self):
+        """
+        {db_name: QuerySet} of every database, only built when the
+        MultiQueryset runs
+        """
+        if self._query_dict is None:
+            self._query_dict = OrderedDict(
+                (db_name, self._template.using(db_name))
+                for db_name in self._databases
+            ) if self._template is not None else OrderedDict()
+        return self._query_dict
 
     def __iter__(self):
-        if not self.order_fields:
-            for query in self.query_dict.values():
-                for i in query:
-                    yield i
+        """
+        work same as queryset.__iter__
+        the merged rows are cached, iterator() streams them instead
+        """
+        self._fetch_all()
+        return iter(self._result_cache)
+
+    def __len__(self):
+        self._fetch_all()
+        return len(self._result_cache)
+
+    def __bool__(self):
+        self._fetch_all()
+        return bool(self._result_cache)
+
+    @_records_skipped
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = list(self._rows())
+
+    def _rows(self):
+        if self.high_mark is not None and self.low_mark >= self.high_mark:
             return
-        result_candidates = []
-        queryset_iterations = {
-            db_name: iter(query)
-            for db_name, query in self.query_dict.items()
-        }
-        for db_name, iter_obj in queryset_iterations.items():
-            try:
-                instance = next(iter_obj)
-                result_candidates.append(
-                    CompatableObject(
-                        db_name=db_name,
-                        order_by=self.order_fields,
-                        instance=instance,
-                    )
-                )
-            except StopIteration:
-                continue
-        heapq.heapify(result_candidates)
-        while result_candidates:
-            result: CompatableObject
-            result = heapq.heappop(result_candidates)
-            try:
-                next_candidate = next(queryset_iterations[result.db_name])
-                heapq.heappush(
-                    result_candidates,
-                    CompatableObject(
-                        result.db_name,
-                        result.order_by,
-                        next_candidate,
-                    )
+        rows = itertools.islice(
+            self._distinct(self._merge()), self.low_mark, self.high_mark)
+        if self._should_prefetch():
+            rows = self._prefetch(list(rows))
+        yield from rows
+
+    async def __aiter__(self):
+        """
+        the databases are queried concurrently, then merged
+        """
+        if self._result_cache is None:
+            with self._recording():
+                self._result_cache = [row async for row in self._arows()]
+        for row in self._result_cache:
+            yield row
+
+    async def _arows(self):
+        if self.high_mark is not None and self.low_mark >= self.high_mark:
+            return
+        if self.group_by is not None:
+            rows = self._grouped_rows(
+                await self._amap(self._cached("rows", _fetch_rows)))
+        else:
+            query_dict, key, strip = self._merge_plan()
+            rows = self._merge_rows(
+                await self._amap(
+                    self._first_row_function(), self._union(query_dict)),
+                key, strip)
+        rows = itertools.islice(
+            self._distinct(rows), self.low_mark, self.high_mark)
+        if self._should_prefetch():
+            rows = await sync_to_async(self._prefetch)(list(rows))
+        for row in rows:
+            yield row
+
+    def iterator(self, chunk_size=None):
+        """
+        work same as queryset.iterator
+        every database streams its rows, only about chunk_size rows of
+        each database are kept in memory during the merge
+        """
+        if self.high_mark is not None and self.low_mark >= self.high_mark:
+            return
+        if self.skipped_databases is not None and _SKIPPED.get() is None:
+            self.skipped_databases = {}
+        kwargs = {} if chunk_size is None else {"chunk_size": chunk_size}
+        if self.group_by is not None:
+            # the groups of every database must be combined before any yield
+            rows = self._grouped_rows(
+                self._map(self._cached("rows", _fetch_rows)))
+        elif self.order_fields:
+            query_dict, key, strip = self._merge_plan()
+            # the cursors belong to the connections of this thread,
+            # so the databases are always read serially here
+            rows = self._merge_rows([
+                (db_name, _first_row(
+                    db_name, self._stream(db_name, query, kwargs)))
+                for db_name, query in self._union(query_dict).items()
+            ], key, strip)
+        else:
+            rows = itertools.chain.from_iterable(
+                self._stream(db_name, query, kwargs)
+                for db_name, query in self._union(self.query_dict).items()
+            )
+        rows = itertools.islice(
+            self._distinct(rows), self.low_mark, self.high_mark)
+        if not self._should_prefetch():
+            yield from rows
+            return
+        # same as queryset.iterator, prefetch every chunk of merged rows
+        chunk_size = chunk_size or 2000
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield from self._prefetch(chunk)
+
+    def _stream(self, db_name, query, kwargs):
+        rows = query.iterator(**kwargs)
+        tracer = self.model.TRACER
+        if tracer is None:
+            return rows
+        return traced_iterator(tracer, db_name, query, rows)
+
+    def __getitem__(self, k):
+        """
+        work same as queryset.__getitem__
+        every database only returns the first `offset + limit` rows,
+        the offset is dropped after the merge
+        """
+        if not isinstance(k, (int, slice)):
+            msg = (
+                "MultiQueryset indices must be integers or slices, not "
+                f"{type(k).__name__}."
+            )
+            raise TypeError(msg)
+        if (isinstance(k, int) and k < 0) or (
+            isinstance(k, slice)
+            and (
+                (k.start is not None and k.start < 0)
+                or (k.stop is not None and k.stop < 0)
+            )
+        ):
+            msg = "Negative indexing is not supported."
+            raise ValueError(msg)
+        if self._result_cache is not None and (
+                isinstance(k, int) or k.step):
+            return self._result_cache[k]
+        clone = self._clone()
+        if isinstance(k, slice):
+            if self._result_cache is not None:
+                # still a MultiQueryset, answered from the cache
+                clone.set_limits(
+                    None if k.start is None else int(k.start),
+                    None if k.stop is None else int(k.stop),
                 )
-            except StopIteration:
-                queryset_iterations.pop(result.db_name)
-            yield result.instance
+                clone._result_cache = self._result_cache[k]
+                return clone
+            clone.set_limits(
+                None if k.start is None else int(k.start),
+                None if k.stop is None else int(k.stop),
+            )
+            if not k.step:
+                return clone
+            with self._recording():
+                return list(clone)[::k.step]
+        clone.set_limits(k, k + 1)
+        with self._recording():
+            for instance in clone:
+                return instance
+        msg = "MultiQueryset index out of range"
+        raise IndexError(msg)
+
+    @property
+    def is_sliced(self):
+        return self.low_mark != 0 or self.high_mark is not None
+
+    def set_limits(self, low=None, high=None):
+        """
+        work same as django.db.models.sql.Query.set_limits
+        the high mark is pushed down to every database as a LIMIT, unless
+        the rows are deduplicated by fields other than the pk
+        """
+        if high is not None:
+            if self.high_mark is not None:
+                self.high_mark = min(self.high_mark, self.low_mark + high)
+            else:
+                self.high_mark = self.low_mark + high
+        if low is not None:
+            if self.high_mark is not None:
+                self.low_mark = min(self.high_mark, self.low_mark + low)
+            else:
+                self.low_mark = self.low_mark + low
+        if self._pushed_high_mark() is not None:
+            self.template = self.template[:self.high_mark]
+
+    def _pushed_high_mark(self):
+        """
+        the LIMIT every database can apply before the merge, a database
+        holds a pk once so the first high_mark rows of every database are
+        enough to deduplicate by pk, but many rows may share another key
+        """
+        if self.group_by is not None or not (
+                self.distinct_fields is None or self._distinct_by_pk()):
+            return None
+        return self.high_mark
+
+    def _merge(self):
+        """
+        merge the results of all the databases by order_fields
+        """
+        fetch_rows = self._cached("rows", _fetch_rows)
+        if self.group_by is not None:
+            yield from self._grouped_rows(self._map(fetch_rows))
+            return
+        if (not self.order_fields and not self._use_executor()
+                and self.skipped_databases is None):
+            for db_name, query in self._union(self.query_dict).items():
+                if fetch_rows is _fetch_rows:
+                    yield from query
+                else:
+                    yield from fetch_rows(db_name, query)
+            return
+        query_dict, key, strip = self._merge_plan()
+        yield from self._merge_rows(
+            self._map(self._first_row_function(), self._union(query_dict)),
+            key, strip)
+
+    def _union(self, query_dict, *, rows=True):
+        """
+        run the databases of UNION_DATABASES that share a host as one
+        UNION ALL query of the host
+        """
+        if not self.model.UNION_DATABASES or self.group_by is not None:
+            return query_dict
+        return union_query_dict(
+            self.model, query_dict,
+            order_fields=self._order_names() if rows else (),
+            high_mark=self._pushed_high_mark() if rows else None,
+            model_rows=rows and self.iterable == "model")
+
+    def _cached(self, kind, function):
+        """
+        wrap function(db_name, query) with the QUERY_CACHE of the model,
+        kind tells apart the different functions run on the same query
+        """
+        function = self._traced(
+            kind, timed_function(self.model.STATEMENT_TIMEOUTS, function))
+        query_cache = self.model.QUERY_CACHE
+        if query_cache is None:
+            return function
+
+        def cached_function(db_name, query):
+            key = query_cache.key(db_name, kind, query)
+            if key is None:
+                return function(db_name, query)
+            hit, value = query_cache.get(key)
+            if not hit:
+                value = function(db_name, query)
+                query_cache.set(key, value)
+            return value
+        return cached_function
+
+    def _traced(self, kind, function):
+        """
+        wrap function(db_name, query) with the TRACER of the model
+        """
+        tracer = self.model.TRACER
+        if tracer is None:
+            return function
+        return traced_function(tracer, kind, function)
+
+    def _first_row_function(self):
+        fetch_rows = self._cached("rows", _fetch_rows)
+        if fetch_rows is _fetch_rows:
+            return _first_row
+        return lambda db_name, query: _first_row(
+            db_name, fetch_rows(db_name, query))
+
+    def _invalidate(self, db_names):
+        """
+        drop the cached results of the databases written to
+        """
+        self._result_cache = None
+        self._query_dict = None
+        _invalidate_databases(self.model, db_names)
+
+    def _grouped_rows(self, results):
+        tracer = self.model.TRACER
+        if tracer is None:
+            return self._combine_groups(results)
+        start = time.perf_counter()
+        rows = self._combine_groups(results)
+        tracer.merge(MergeEvent(
+            self.model, [db_name for db_name, _ in results], len(rows),
+            time.perf_counter() - start, None))
+        return rows
+
+    def _combine_groups(self, results):
+        """
+        combine the groups of every database, then sort them by order_fields
+        """
+        groups = OrderedDict()
+        for _, rows in results:
+            for row in rows:
+                key = tuple(row[column] for column in self.group_by)
+                groups.setdefault(key, []).append(row)
+        rows = []
+        for key, partial_rows in groups.items():
+            row = dict(zip(self.group_by, key))
+            for alias, aggregate in self.group_aggregates.items():
+                row[alias] = combine_aggregate(alias, aggregate, partial_rows)
+            rows.append(row)
+        if self.order_fields:
+            rows.sort(key=self._sort_key(operator.itemgetter(
+                *[name for name, _ in self._order_pairs()])))
+        columns = self.group_select or [*self.group_by, *self.group_aggregates]
+        if self.group_select:
+            rows = [{column: row[column] for column in columns} for row in rows]
+        if self.iterable == "values":
+            return rows
+        if self.iterable == "flat":
+            return [row[columns[0]] for row in rows]
+        if self.iterable == "named":
+            row_class = create_namedtuple_class(*columns)
+            return [row_class(*row.values()) for row in rows]
+        return [tuple(row.values()) for row in rows]
+
+    def _merge_rows(self, first_rows, key=None, strip=None):
+        """
+        merge [(db_name, (iterator, first_row))] by the sort key
+        """
+        tracer = self.model.TRACER
+        if tracer is None:
+            return self._heap_merge(first_rows, key, strip)
+
+        def merge(key_wrapper):
+            traced_key = None
+            if key is not None:
+                traced_key = lambda row: key_wrapper(key(row))  # noqa: E731
+            return self._heap_merge(first_rows, traced_key, strip)
+        return traced_merge(
+            tracer, self.model, [db_name for db_name, _ in first_rows], merge)
+
+    def _heap_merge(self, first_rows, key=None, strip=None):
+        if strip is not None:
+            yield from map(strip, self._heap_merge(first_rows, key))
+            return
+        if key is None:
+            for _, (iter_obj, instance) in first_rows:
+                if instance is _EMPTY:
+                    continue
+                yield instance
+                yield from iter_obj
+            return
+        heap = []
+        for index, (_, (iter_obj, row)) in enumerate(first_rows):
+            if row is not _EMPTY:
+                # the index breaks ties, so rows are never compared
+                heap.append((key(row), index, row, iter_obj))
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            _, index, row, iter_obj = heap[0]
+            yield row
+            next_row = next(iter_obj, _EMPTY)
+            if next_row is _EMPTY:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(
+                    heap, (key(next_row), index, next_row, iter_obj))
+        if heap:
+            # only one database left, no need to compare any more
+            _, _, row, iter_obj = heap[0]
+            yield row
+            yield from iter_obj
+
+    def _nulls_largest(self):
+        """
+        the merge must put NULL where the databases put it
+        """
+        db_name = next(iter(self.databases), "default")
+        return connections[db_name].features.nulls_order_largest
+
+    def _order_field(self, name):
+        if name == "pk":
+            return self.model._meta.pk
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def _merge_plan(self):
+        """
+        return (query_dict, key, strip) for the merge, order fields missing
+        from the projection are selected as extra columns and stripped
+        from the rows after the merge
+        """
+        if not self.order_fields or not self.query_dict:
+            return self.query_dict, None, None
+        if self.iterable == "model":
+            return self._load_order_fields(), self._sort_key(), None
+        query = self.template.query
+        columns = [
+            *query.extra_select, *query.values_select,
+            *query.annotation_select,
+        ]
+        order_columns = []
+        extra = []
+        for name, _ in self._order_pairs():
+            field = self._order_field(name)
+            candidates = [name]
+            if field is not None and field.concrete:
+                candidates += [field.attname, field.name]
+                if field.primary_key:
+                    candidates.append("pk")
+            column = next((c for c in candidates if c in columns), None)
+            if column is None:
+                column = name
+                extra.append(name)
+            order_columns.append(column)
+        query_dict = self.query_dict
+        if extra:
+            method = "values" if self.iterable == "values" else "values_list"
+            query_dict = OrderedDict(
+                (db_name, getattr(query, method)(*columns, *extra))
+                for db_name, query in self.query_dict.items()
+            )
+        if self.iterable == "values":
+            getter = operator.itemgetter(*order_columns)
+        elif self.iterable == "flat" and not extra:
+            # every order field is the only selected column
+            size = len(order_columns)
+            getter = (lambda row: row) if size == 1 else (
+                lambda row: (row,) * size)
+        else:
+            getter = operator.itemgetter(*[
+                (columns + extra).index(column) for column in order_columns
+            ])
+        return query_dict, self._sort_key(getter), self._strip(columns, extra)
+
+    def _strip(self, columns, extra):
+        """
+        return the function that removes the extra order columns from a row
+        """
+        if not extra:
+            return None
+        if self.iterable == "values":
+            def strip_values(row):
+                for name in extra:
+                    del row[name]
+                return row
+            return strip_values
+        size = len(columns)
+        if self.iterable == "flat":
+            return operator.itemgetter(0)
+        if self.iterable == "named":
+            row_class = create_namedtuple_class(*columns)
+            return lambda row: row_class(*row[:size])
+        return lambda row: row[:size]
+
+    def _load_order_fields(self):
+        """
+        make sure the order fields are not deferred by only() or defer(),
+        otherwise every comparison would query the database
+        """
+        order_names = set()
+        for name, _ in self._order_pairs():
+            field = self._order_field(name)
+            if field is not None and field.concrete and not field.primary_key:
+                order_names.add(field.name)
+        query = self.template
+        names, defer = query.query.deferred_loading
+        if defer and names & order_names:
+            return OrderedDict(
+                (db_name, query.defer(None).defer(*(names - order_names)))
+                for db_name, query in self.query_dict.items()
+            )
+        if not defer and names and order_names - names:
+            return OrderedDict(
+                (db_name, query.only(*names, *(order_names - names)))
+                for db_name, query in self.query_dict.items()
+            )
+        return self.query_dict
+
+    def _sort_key(self, getter=None):
+        """
+        build the function that turns a row into its sort key once,
+        so the heap only compares plain tuples
+        """
+        nulls_largest = self._nulls_largest()
+        names = []
+        transforms = []
+        for name, descending in self._order_pairs():
+            field = self._order_field(name)
+            if field is not None and field.concrete:
+                names.append(field.attname)
+            else:
+                names.append(name)
+            transforms.append(_value_transform(
+                descending,
+                numeric=(field is not None
+                         and field.get_internal_type() in _NUMERIC_FIELDS),
+                nullable=field is None or field.null,
+                null_last=nulls_largest != descending,
+            ))
+        if getter is None:
+            getter = operator.attrgetter(*names)
+        if len(names) == 1:
+            transform = transforms[0]
+            if transform is None:
+                return getter
+            return lambda row: transform(getter(row))
+        if not any(transforms):
+            return getter
+        transforms = [
+            transform or (lambda value: value) for transform in transforms
+        ]
+        return lambda row: tuple(
+            transform(value)
+            for transform, value in zip(transforms, getter(row))
+        )
 
     def _clone(self):
         c = self.__class__(
                 model=self.model,
                 order_fields=self.order_fields,
+                executor=self.executor,
         )
-        c.query_dict = self.query_dict.copy()
+        # the template is never evaluated, so the clones can share it
+        c._template = self._template
+        c._databases = self._databases
+        c.iterable = self.iterable
+        c.group_by = self.group_by
+        c.group_aggregates = self.group_aggregates.copy()
+        c.group_select = self.group_select
+        c.low_mark = self.low_mark
+        c.high_mark = self.high_mark
+        c.prefetch_lookups = self.prefetch_lookups
+        c.distinct_fields = self.distinct_fields
+        c.skipped_databases = None if self.skipped_databases is None else {}
         return c
 
+    def parallel(self, executor=None):
+        """
+        query all the databases concurrently with the executor,
+        use the shared thread pool if executor is not given
+        """
+        clone = self._clone()
+        clone.executor = executor or get_default_executor()
+        return clone
+
+    def degraded(self):
+        """
+        skip the databases that raise a DatabaseError, e.g. a statement
+        timeout, the reads return the rows of the databases that answered
+        and skipped_databases tells which databases the last evaluation
+        skipped. Writes and the rows streamed by iterator() still raise
+        """
+        clone = self._clone()
+        clone.skipped_databases = {}
+        return clone
+
+    def distinct_across_databases(self, *fields, precedence=None):
+        """
+        yield a row only once when the same pk, or the same fields, is in
+        several databases, e.g. while archive() moves the rows
+
+        the databases are merged in the order of precedence, so the copy of
+        the first database wins when the copies are the same. The rows are
+        deduplicated while they are merged, an ordering starting with the
+        fields only remembers the last key, otherwise every key is kept
+        """
+        if self.group_by is not None:
+            msg = "Cannot deduplicate the groups of a MultiQueryset."
+            raise NotSupportedError(msg)
+        if self.is_sliced:
+            msg = "Cannot create distinct fields once a slice has been taken."
+            raise TypeError(msg)
+        clone = self._clone()
+        clone.distinct_fields = fields or ("pk",)
+        if precedence:
+            unknown = set(precedence) - set(self.model.DATABASES)
+            if unknown:
+                msg = f"Unknown databases in precedence: {sorted(unknown)}."
+                raise ValueError(msg)
+            first = [db_name for db_name in precedence
+                     if db_name in clone.databases]
+            clone.databases = [*first, *(
+                db_name for db_name in clone.databases
+                if db_name not in first)]
+        return clone
+
+    def _distinct_by_pk(self):
+        pk = self.model._meta.pk
+        return list(self.distinct_fields) in (["pk"], [pk.name], [pk.attname])
+
+    def _distinct_key(self):
+        """
+        return the function that gets the distinct fields of a row
+        """
+        fields = [
+            self.model._meta.pk.name if name == "pk" else name
+            for name in self.distinct_fields
+        ]
+        if self.iterable == "model":
+            attnames = []
+            for name in fields:
+                field = self._order_field(name)
+                attnames.append(name if field is None else field.attname)
+            return operator.attrgetter(*attnames)
+        query = self.template.query
+        columns = [
+            *query.extra_select, *query.values_select,
+            *query.annotation_select,
+        ]
+        pk = self.model._meta.pk
+        positions = []
+        for name in fields:
+            candidates = [name]
+            if name == pk.name:
+                candidates += ["pk", pk.attname]
+            column = next((c for c in candidates if c in columns), None)
+            if column is None:
+                msg = f"values() of a distinct MultiQueryset must select {name}."
+                raise NotSupportedError(msg)
+            positions.append(column)
+        if self.iterable == "values":
+            return operator.itemgetter(*positions)
+        if self.iterable == "flat":
+            return lambda row: row
+        return operator.itemgetter(*[columns.index(c) for c in positions])
+
+    def _distinct(self, rows):
+        """
+        drop the rows whose distinct fields were already yielded
+        """
+        if self.distinct_fields is None:
+            yield from rows
+            return
+        key = self._distinct_key()
+        order_names = [
+            self.model._meta.pk.name if name == "pk" else name
+            for name, _ in self._order_pairs()
+        ] if self.order_fields else []
+        distinct_names = [
+            self.model._meta.pk.name if name == "pk" else name
+            for name in self.distinct_fields
+        ]
+        if order_names[:len(distinct_names)] == distinct_names:
+            # the copies of a row are next to each other
+            last = _EMPTY
+            for row in rows:
+                row_key = key(row)
+                if row_key != last:
+                    last = row_key
+                    yield row
+            return
+        seen = set()
+        for row in rows:
+            row_key = key(row)
+            if row_key not in seen:
+                seen.add(row_key)
+                yield row
+
+    def _in_transaction(self):
+        """
+        worker threads can not see the uncommitted data of the current
+        thread, so queries must stay in this thread inside a transaction
+        """
+        return any(
+            connections[db_name].in_atomic_block
+            for db_name in self.query_dict
+        )
+
+    def _use_executor(self):
+        if self.executor is None or len(self.query_dict) <= 1:
+            return False
+        return not self._in_transaction()
+
+    def _map(self, function, query_dict=None, *, partial=True):
+        """
+        run function(db_name, query) for every database,
+        return [(db_name, result)] in the order of query_dict,
+        a degraded queryset leaves out the databases that failed
+        unless partial is False
+        """
+        if query_dict is None:
+            query_dict = self.query_dict
+        if partial and self.skipped_databases is not None:
+            return self._partial(self._map(
+                skipping_function(function), self._available(query_dict),
+                partial=False))
+        if len(query_dict) <= 1 or not self._use_executor():
+            return [
+                (db_name, function(db_name, query))
+                for db_name, query in query_dict.items()
+            ]
+        futures = [
+            (db_name, self.executor.submit(
+                _run_with_connection, db_name, function, query))
+            for db_name, query in query_dict.items()
+        ]
+        return [(db_name, future.result()) for db_name, future in futures]
+
+    async def _amap(self, function, query_dict=None, *, partial=True):
+        """
+        async version of _map, the databases are always queried concurrently
+        unless there is a transaction
+        """
+        if query_dict is None:
+            query_dict = self.query_dict
+        if partial and self.skipped_databases is not None:
+            return self._partial(await self._amap(
+                skipping_function(function), self._available(query_dict),
+                partial=False))
+        if await sync_to_async(self._in_transaction)():
+            call = sync_to_async(function)
+            return [
+                (db_name, await call(db_name, query))
+                for db_name, query in query_dict.items()
+            ]
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(
+                self.executor, _run_with_connection, db_name, function, query)
+            for db_name, query in query_dict.items()
+        ])
+        return list(zip(query_dict, results))
+
+    def _available(self, query_dict):
+        """
+        leave out the databases that failed less than DEGRADED_RETRY_AFTER
+        seconds ago, unless all of them did
+        """
+        failed = failed_databases(query_dict, self.model.DEGRADED_RETRY_AFTER)
+        if not failed or len(failed) == len(query_dict):
+            return query_dict
+        for db_name, error in failed.items():
+            self._skip(db_name, error)
+        return OrderedDict(
+            (db_name, query) for db_name, query in query_dict.items()
+            if db_name not in failed
+        )
+
+    def _partial(self, results):
+        """
+        leave out and remember the skipped databases, raise the error of
+        the first database if none answered
+        """
+        answered = []
+        for db_name, result in results:
+            if isinstance(result, Skipped):
+                LOGGER.warning("%s skipped %s: %s", self.model.__name__,
+                               db_name, result.error)
+                self._skip(db_name, result.error)
+            else:
+                answered.append((db_name, result))
+        if results and not answered:
+            raise results[0][1].error
+        return answered
+
+    @contextmanager
+    def _recording(self):
+        """
+        collect the databases skipped while evaluating this queryset, the
+        rows of a cached queryset come from an earlier evaluation
+        """
+        if (self.skipped_databases is None or _SKIPPED.get() is not None
+                or self._result_cache is not None):
+            yield
+            return
+        self.skipped_databases = {}
+        token = _SKIPPED.set(self.skipped_databases)
+        try:
+            yield
+        finally:
+            _SKIPPED.reset(token)
+
+    def _skip(self, db_name, error):
+        skipped = _SKIPPED.get()
+        if skipped is None:
+            skipped = self.skipped_databases
+        skipped[db_name] = error
+
+    def _tiers(self, concurrent):
+        """
+        return the lists of databases to query one after another,
+        DATABASE_TIERS of the model or every database in its own tier,
+        or all the databases together when they are queried concurrently
+        """
+        tiers = self.model.DATABASE_TIERS
+        if not tiers:
+            if concurrent:
+                return [list(self.query_dict)]
+            return [[db_name] for db_name in self.query_dict]
+        listed = {db_name for tier in tiers for db_name in tier}
+        result = [
+            [db_name for db_name in tier if db_name in self.query_dict]
+            for tier in tiers
+        ]
+        result.append([
+            db_name for db_name in self.query_dict if db_name not in listed
+        ])
+        return [tier for tier in result if tier]
+
+    def _map_tiers(self, function):
+        """
+        run function tier by tier, stop iterating once the answer is found
+        """
+        for tier in self._tiers(self.executor is not None):
+            yield self._map(function, OrderedDict(
+                (db_name, self.query_dict[db_name]) for db_name in tier))
+
+    async def _amap_tiers(self, function):
+        for tier in self._tiers(True):
+            yield await self._amap(function, OrderedDict(
+                (db_name, self.query_dict[db_name]) for db_name in tier))
+
     def run_function_for_all_query(self, function, *args, **kwargs):
         clone = self._clone()
-        for db_name, query in clone.query_dict.items():
-            query = getattr(query, function)(*args, **kwargs)
-            clone.query_dict[db_name] = query
+        clone.template = getattr(self.template, function)(*args, **kwargs)
         return clone
 
+    def _check_filter(self, args, kwargs):
+        if (args or kwargs) and self.is_sliced:
+            msg = "Cannot filter a query once a slice has been taken."
+            raise TypeError(msg)
+        if self.group_by is None:
+            return
+        if args or any(
+                lookup.split(LOOKUP_SEP)[0] in self.group_aggregates
+                for lookup in kwargs):
+            msg = (
+                "Cannot filter on the aggregates of a MultiQueryset, "
+                "every database only has partial aggregates."
+            )
+            raise NotSupportedError(msg)
+
     def exclude(self, *args, **kwargs):
+        self._check_filter(args, kwargs)
         return self.run_function_for_all_query(
                 "exclude", *args, **kwargs
         )
@@ -122,63 +1101,827 @@ class MultiQueryset:
                 "all", *args, **kwargs
         )
 
+    def _select_groups(self, iterable, fields):
+        """
+        values() after the aggregates only selects from the combined groups
+        """
+        columns = [*self.group_by, *self.group_aggregates]
+        if any(field not in columns for field in fields):
+            msg = (
+                "values() after aggregates can only select the grouped "
+                "columns and the aggregates of a MultiQueryset."
+            )
+            raise NotSupportedError(msg)
+        clone = self._clone()
+        clone.iterable = iterable
+        clone.group_select = fields or None
+        return clone
+
+    def values(self, *fields, **expressions):
+        """work same as queryset.values"""
+        if self.group_by is not None:
+            return self._select_groups("values", (*fields, *expressions))
+        clone = self.run_function_for_all_query(
+                "values", *fields, **expressions
+        )
+        clone.iterable = "values"
+        return clone
+
+    def values_list(self, *fields, flat=False, named=False):
+        """work same as queryset.values_list"""
+        if flat:
+            iterable = "flat"
+        elif named:
+            iterable = "named"
+        else:
+            iterable = "values_list"
+        if self.group_by is not None:
+            return self._select_groups(iterable, fields)
+        clone = self.run_function_for_all_query(
+                "values_list", *fields, flat=flat, named=named
+        )
+        clone.iterable = iterable
+        return clone
+
+    def annotate(self, *args, **kwargs):
+        """
+        work same as queryset.annotate
+        aggregates after values() group the rows of all the databases,
+        every database computes partial aggregates of its groups
+        """
+        annotations = dict(kwargs)
+        for arg in args:
+            try:
+                annotations[arg.default_alias] = arg
+            except (AttributeError, TypeError) as exc:
+                msg = "Complex annotations require an alias"
+                raise TypeError(msg) from exc
+        has_aggregate = any(
+            getattr(annotation, "contains_aggregate", False)
+            for annotation in annotations.values()
+        )
+        if self.group_by is None and (
+                self.iterable == "model" or not has_aggregate):
+            return self.run_function_for_all_query("annotate", **annotations)
+        if not all(
+                getattr(annotation, "contains_aggregate", False)
+                for annotation in annotations.values()):
+            msg = (
+                "Cannot mix aggregates and other annotations "
+                "after values() on a MultiQueryset."
+            )
+            raise NotSupportedError(msg)
+        if self.is_sliced:
+            msg = "Cannot annotate a query once a slice has been taken."
+            raise TypeError(msg)
+        if self.distinct_fields is not None:
+            msg = "Cannot deduplicate the groups of a MultiQueryset."
+            raise NotSupportedError(msg)
+        partials = {}
+        for alias, aggregate in annotations.items():
+            partials.update(partial_aggregates(alias, aggregate))
+        clone = self._clone()
+        query = clone.template
+        if clone.group_by is None:
+            clone.group_by = (
+                *query.query.extra_select, *query.query.values_select,
+                *query.query.annotation_select,
+            )
+            # the groups are sorted after they are combined, ordering
+            # every database would only add columns to the GROUP BY
+            query = query.values(*clone.group_by).order_by()
+        clone.template = query.annotate(**partials)
+        clone.group_aggregates.update(annotations)
+        return clone
+
+    def select_related(self, *fields):
+        """work same as queryset.select_related"""
+        if self.iterable != "model":
+            msg = "Cannot call select_related() after .values() or .values_list()"
+            raise TypeError(msg)
+        return self.run_function_for_all_query("select_related", *fields)
+
+    def prefetch_related(self, *lookups):
+        """
+        work same as queryset.prefetch_related
+        the merged rows are prefetched together by database, so every
+        lookup runs once per database instead of once per row
+        """
+        clone = self._clone()
+        if lookups == (None,):
+            clone.prefetch_lookups = ()
+        else:
+            clone.prefetch_lookups = clone.prefetch_lookups + lookups
+        return clone
+
+    def _should_prefetch(self):
+        return (self.prefetch_lookups and self.iterable == "model"
+                and self.group_by is None)
+
+    def _prefetch(self, rows):
+        """
+        prefetch_related_objects of the rows of every database, the related
+        managers read from the database of the first instance
+        """
+        rows_by_db = OrderedDict()
+        for row in rows:
+            rows_by_db.setdefault(row._state.db, []).append(row)
+        for db_rows in rows_by_db.values():
+            models.prefetch_related_objects(db_rows, *self.prefetch_lookups)
+        return rows
+
+    def _prefetch_one(self, instance):
+        if instance is not None and self._should_prefetch():
+            self._prefetch([instance])
+        return instance
+
+    def only(self, *fields):
+        """work same as queryset.only"""
+        return self.run_function_for_all_query("only", *fields)
+
+    def defer(self, *fields):
+        """work same as queryset.defer"""
+        return self.run_function_for_all_query("defer", *fields)
+
     def filter(self, *args, **kwargs):
-        """work same as queryset.filter"""
-        return self.run_function_for_all_query(
+        """
+        work same as queryset.filter
+        databases whose DATABASE_RANGES can not match the filter are dropped
+        """
+        self._check_filter(args, kwargs)
+        return self._prune(args, kwargs).run_function_for_all_query(
                 "filter", *args, **kwargs
         )
 
-    def count(self, *args, **kwargs):
-        """work same as queryset.count"""
-        result = 0
-        for query in self.query_dict.values():
-            result += query.count(*args, **kwargs)
-        return result
+    def _prune(self, args, kwargs):
+        """
+        return a clone without the databases that can not hold any row
+        matching the filter
+        """
+        ranges = getattr(self.model, "DATABASE_RANGES", None)
+        partition = getattr(self.model, "PARTITION", None)
+        if not (ranges or partition) or not (args or kwargs):
+            return self
+        conditions = list(lookup_conditions(self.model, args, kwargs))
+        if not conditions:
+            return self
+        owners = self._partition_owners(partition, conditions)
+        clone = self._clone()
+        clone.databases = [
+            db_name for db_name in self.databases
+            if (owners is None or db_name in owners) and (
+                not ranges or may_contain(
+                    database_ranges(self.model, db_name), conditions))
+        ]
+        if not clone.databases:
+            # keep an empty queryset so the clone still knows its database
+            clone.databases = self.databases[:1]
+            clone.template = self.template.none()
+        return clone
+
+    def _partition_owners(self, partition, conditions):
+        """
+        return the databases owning the values the PARTITION field is
+        filtered by, None if any database may hold the rows
+        """
+        if partition is None:
+            return None
+        name = partition.field_name(self.model)
+        owners = None
+        for field_name, lookup, value in conditions:
+            if field_name != name:
+                continue
+            try:
+                databases = partition.lookup_databases(lookup, value)
+            except (TypeError, ValueError):
+                # let the database reject the value
+                databases = None
+            if databases is not None:
+                owners = databases if owners is None else owners & databases
+        return owners
+
+    @_records_skipped
+    def count(self, *args, approximate=None, **kwargs):
+        """
+        work same as queryset.count
+        approximate=True counts the APPROXIMATE_COUNT_TIMEOUTS databases
+        from their statistics or a cached count, None uses
+        APPROXIMATE_COUNT of the model
+        """
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        if self.group_by is not None:
+            # groups of different databases may be the same group
+            return sum(1 for _ in self)
+        if self.distinct_fields is not None:
+            return self._count_result(
+                [(None, len(self._distinct_keys(
+                    self._map(self._distinct_keys_function()))))])
+        return self._count_result(self._map(
+            self._count_function(approximate, args, kwargs),
+            self._union(self.query_dict, rows=False)))
+
+    @_records_skipped
+    async def acount(self, *args, approximate=None, **kwargs):
+        """work same as queryset.acount"""
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        if self.group_by is not None:
+            return len([row async for row in self])
+        if self.distinct_fields is not None:
+            return self._count_result(
+                [(None, len(self._distinct_keys(
+                    await self._amap(self._distinct_keys_function()))))])
+        return self._count_result(await self._amap(
+            self._count_function(approximate, args, kwargs),
+            self._union(self.query_dict, rows=False)))
+
+    def _count_function(self, approximate, args, kwargs):
+        exact = self._cached(
+            "count", lambda _, query: query.count(*args, **kwargs))
+        if approximate is None:
+            approximate = self.model.APPROXIMATE_COUNT
+        if not approximate:
+            return exact
+        timeouts = self.model.APPROXIMATE_COUNT_TIMEOUTS
+
+        def count(db_name, query):
+            if timeouts.get(db_name):
+                return approximate_count(db_name, query)
+            return exact(db_name, query)
+        return count
+
+    def _distinct_keys_function(self):
+        fields = self.distinct_fields
+        return self._cached(
+            f"distinct {fields!r}",
+            lambda _, query: list(query.values_list(
+                *fields, flat=len(fields) == 1)))
+
+    @staticmethod
+    def _distinct_keys(results):
+        """
+        the distinct keys of all the databases, a count by pk reads one
+        column of every row
+        """
+        keys = set()
+        for _, rows in results:
+            keys.update(rows)
+        return keys
+
+    def _count_result(self, counts):
+        """
+        apply the slice to the total, the counts of a distinct queryset
+        are its distinct keys, only limited when deduplicated by pk
+        """
+        result = sum(count for _, count in counts)
+        if self.high_mark is not None:
+            result = min(result, self.high_mark)
+        return max(0, result - self.low_mark)
+
+    def _split_aggregates(self, args, kwargs):
+        """
+        return the aggregates by alias and the partial aggregates
+        every database should compute
+        """
+        if self.is_sliced or self.group_by is not None:
+            msg = "Cannot aggregate a sliced or grouped MultiQueryset."
+            raise NotSupportedError(msg)
+        if self.distinct_fields is not None:
+            msg = (
+                "Cannot aggregate a distinct MultiQueryset, the copies of "
+                "a row would be aggregated by every database."
+            )
+            raise NotSupportedError(msg)
+        aggregates = dict(kwargs)
+        for arg in args:
+            try:
+                aggregates[arg.default_alias] = arg
+            except (AttributeError, TypeError) as exc:
+                msg = "Complex aggregates require an alias"
+                raise TypeError(msg) from exc
+        partials = {}
+        for alias, aggregate in aggregates.items():
+            partials.update(partial_aggregates(alias, aggregate))
+        return aggregates, partials
+
+    @staticmethod
+    def _combine_aggregates(aggregates, results):
+        # a UNION ALL returns the rows of all its databases
+        results = [
+            row for _, result in results
+            for row in (result if isinstance(result, list) else [result])
+        ]
+        return {
+            alias: combine_aggregate(alias, aggregate, results)
+            for alias, aggregate in aggregates.items()
+        }
+
+    @_records_skipped
+    def aggregate(self, *args, **kwargs):
+        """
+        work same as queryset.aggregate
+        every database computes partial aggregates which are combined here
+        """
+        aggregates, partials = self._split_aggregates(args, kwargs)
+        return self._combine_aggregates(aggregates, self._map(
+            self._aggregate_function(partials),
+            self._union_aggregates(partials)))
+
+    @_records_skipped
+    async def aaggregate(self, *args, **kwargs):
+        """work same as queryset.aaggregate"""
+        aggregates, partials = self._split_aggregates(args, kwargs)
+        return self._combine_aggregates(aggregates, await self._amap(
+            self._aggregate_function(partials),
+            self._union_aggregates(partials)))
+
+    def _aggregate_function(self, partials):
+        def aggregate(db_name, query):  # pylint: disable=unused-argument  # noqa: ARG001
+            if query.query.combinator:
+                return list(query)
+            return query.aggregate(**partials)
+        return self._cached(f"aggregate {partials!r}", aggregate)
+
+    def _union_aggregates(self, partials):
+        if not self.model.UNION_DATABASES:
+            return self.query_dict
+        return union_aggregates(self.model, self.query_dict, partials)
 
     def order_by(self, *field_names):
         """work same as queryset.order_by"""
-        self.order_fields = field_names
+        if self.is_sliced:
+            msg = "Cannot reorder a query once a slice has been taken."
+            raise TypeError(msg)
+        if self.group_by is not None:
+            # the groups are sorted after they are combined
+            clone = self._clone()
+            clone.order_fields = field_names
+            return clone
         new_query = self.run_function_for_all_query(
                 "order_by", *field_names
         )
         new_query.order_fields = field_names
         return new_query
 
+    def reverse(self):
+        """
+        work same as queryset.reverse
+        every database sorts the other way, so the first rows of the
+        reversed merge only cost a LIMIT on every database
+        """
+        if self.is_sliced:
+            msg = "Cannot reverse a query once a slice has been taken."
+            raise TypeError(msg)
+        fields = list(self.order_fields or self.model._meta.ordering)
+        if not fields:
+            return self._clone()
+        if self.group_by is None and not any(
+                field.lstrip("-") in ("pk", self.model._meta.pk.name)
+                for field in fields):
+            # the pk the merge breaks ties with must be reversed too
+            fields.append("pk")
+        return self.order_by(*[
+            field[1:] if field.startswith("-") else "-" + field
+            for field in fields
+        ])
+
+    def _order_pairs(self):
+        """
+        return the (field_name, descending) of order_fields,
+        pk is appended to make the ordering unique unless rows are groups
+        """
+        fields = []
+        for field in self.order_fields:
+            if not isinstance(field, str) or field == "?":
+                msg = "MultiQueryset only supports ordering by field names."
+                raise TypeError(msg)
+            if field.startswith("-"):
+                fields.append((field[1:], True))
+            else:
+                fields.append((field, False))
+        if self.group_by is None and not any(
+                name in ("pk", self.model._meta.pk.name) for name, _ in fields):
+            fields.append(("pk", False))
+        return fields
+
+    def _order_names(self):
+        """
+        order_fields with the pk that breaks ties, for the queries whose
+        rows are merged by _order_pairs()
+        """
+        if not self.order_fields:
+            return ()
+        return [
+            "-" + name if descending else name
+            for name, descending in self._order_pairs()
+        ]
+
+    def get_cursor(self, instance) -> str:
+        """
+        encode the order_fields values and pk of instance,
+        pass the result to `after` to get the next page
+        """
+        values = []
+        for name, _ in self._order_pairs():
+            field = self._order_field(name)
+            if field is None or not field.concrete:
+                values.append(getattr(instance, name))
+                continue
+            value = getattr(instance, field.attname)
+            # the string of the field keeps every digit, the json encoder
+            # cuts the microseconds of a datetime
+            values.append(
+                None if value is None else field.value_to_string(instance))
+        data = json.dumps(values, cls=DjangoJSONEncoder).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def after(self, cursor=None, limit=None):
+        """
+        keyset pagination, return the `limit` rows after the cursor
+        every database only returns `limit` rows no matter how deep the page is
+        """
+        fields = self._order_pairs()
+        new_query = self.order_by(*[
+            f"-{name}" if descending else name
+            for name, descending in fields
+        ])
+        if cursor is not None:
+            try:
+                values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            except ValueError as exc:
+                msg = "Invalid cursor"
+                raise ValueError(msg) from exc
+            if not isinstance(values, list) or len(values) != len(fields):
+                msg = "Invalid cursor"
+                raise ValueError(msg)
+            try:
+                values = [
+                    self._cursor_value(name, value)
+                    for (name, _), value in zip(fields, values)
+                ]
+            except ValidationError as exc:
+                msg = "Invalid cursor"
+                raise ValueError(msg) from exc
+            new_query = new_query.filter(
+                self._keyset_filter(fields, values, self._nulls_largest()))
+        if limit is not None:
+            new_query = new_query[:limit]
+        return new_query
+
+    def _cursor_value(self, name, value):
+        field = self._order_field(name)
+        if value is None or field is None or not field.concrete:
+            return value
+        return field.to_python(value)
+
+    @staticmethod
+    def _keyset_filter(fields, values, nulls_largest):
+        """
+        build the Q for rows strictly after values,
+        NULL is placed the same way as the databases do
+        """
+        condition = models.Q(pk__in=[])
+        equal = models.Q()
+        for (name, descending), value in zip(fields, values):
+            null_last = nulls_largest != descending
+            if value is None:
+                if not null_last:
+                    condition |= equal & models.Q(**{f"{name}__isnull": False})
+                equal &= models.Q(**{f"{name}__isnull": True})
+                continue
+            after = models.Q(**{
+                f"{name}__lt" if descending else f"{name}__gt": value})
+            if null_last:
+                after |= models.Q(**{f"{name}__isnull": True})
+            condition |= equal & after
+            equal &= models.Q(**{name: value})
+        return condition
+
     def using(self, alias: str):
         """work same as queryset.using"""
         return self.query_dict[alias]
 
-    def get(self, *args, **kwargs):
-        """work same as queryset.get"""
-        results = []
-        for query in self.query_dict.values():
+    def _get_function(self, *args, **kwargs):
+        def get_or_none(db_name, query):  # pylint: disable=unused-argument  # noqa: ARG001
             try:
-                instance = query.get(*args, **kwargs)
+                return query.get(*args, **kwargs)
             except self.model.DoesNotExist:
-                continue
+                return None
+        return get_or_none
+
+    def _unique_lookup(self, kwargs):
+        """
+        whether kwargs looks up a field declared in UNIQUE_ACROSS_DATABASES,
+        then at most one database can hold the row
+        """
+        pk_name = self.model._meta.pk.name
+        unique = {
+            pk_name if name == "pk" else name
+            for name in self.model.UNIQUE_ACROSS_DATABASES
+        }
+        for lookup in kwargs:
+            parts = lookup.split(LOOKUP_SEP)
+            name = pk_name if parts[0] == "pk" else parts[0]
+            if name in unique and parts[1:] in ([], ["exact"]):
+                return True
+        return False
+
+    @_records_skipped
+    def get(self, *args, **kwargs):
+        """
+        work same as queryset.get
+        a unique lookup stops at the first tier that has the row
+        """
+        if self.group_by is not None:
+            rows = self.filter(*args, **kwargs)[:2]
+            return self._get_result([(None, row) for row in rows])
+        queryset = self._prune(args, kwargs)
+        function = self._traced("get", timed_function(
+            self.model.STATEMENT_TIMEOUTS, self._get_function(*args, **kwargs)))
+        if not self._unique_lookup(kwargs):
             # if MultipleObjectsReturned raised, just raise it
-            results.append(instance)
+            return self._prefetch_one(
+                self._get_result(queryset._map(function)))
+        for results in queryset._map_tiers(function):
+            if any(instance is not None for _, instance in results):
+                return self._prefetch_one(self._get_result(results))
+        return self._get_result([])
+
+    @_records_skipped
+    async def aget(self, *args, **kwargs):
+        """work same as queryset.aget"""
+        if self.group_by is not None:
+            rows = [row async for row in self.filter(*args, **kwargs)[:2]]
+            return self._get_result([(None, row) for row in rows])
+        queryset = self._prune(args, kwargs)
+        function = self._traced("get", timed_function(
+            self.model.STATEMENT_TIMEOUTS, self._get_function(*args, **kwargs)))
+        if not self._unique_lookup(kwargs):
+            return await sync_to_async(self._prefetch_one)(
+                self._get_result(await queryset._amap(function)))
+        async for results in queryset._amap_tiers(function):
+            if any(instance is not None for _, instance in results):
+                return await sync_to_async(self._prefetch_one)(
+                    self._get_result(results))
+        return self._get_result([])
+
+    def _get_result(self, instances):
+        results = [
+            instance for _, instance in instances
+            if instance is not None
+        ]
+        if self.distinct_fields is not None and len(results) > 1:
+            results = list(self._distinct(results))
         if len(results) == 1:
             return results[0]
-        raise self.model.MultipleObjectsReturned
+        if not results:
+            msg = f"{self.model._meta.object_name} matching query does not exist."
+            raise self.model.DoesNotExist(msg)
+        msg = (
+            f"get() returned more than one {self.model._meta.object_name} "
+            f"-- it returned {len(results)}!"
+        )
+        raise self.model.MultipleObjectsReturned(msg)
 
+    @_records_skipped
     def exists(self):
-        for query in self.query_dict.values():
-            if query.exists():
+        """
+        work same as queryset.exists
+        stop at the first tier that has a row
+        """
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        if self.low_mark:
+            for _ in self[:1]:
+                return True
+            return False
+        for results in self._map_tiers(self._cached(
+                "exists", lambda _, query: query.exists())):
+            if any(result for _, result in results):
                 return True
         return False
 
+    @_records_skipped
+    async def aexists(self):
+        """work same as queryset.aexists"""
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        if self.low_mark:
+            async for _ in self[:1]:
+                return True
+            return False
+        async for results in self._amap_tiers(self._cached(
+                "exists", lambda _, query: query.exists())):
+            if any(result for _, result in results):
+                return True
+        return False
+
+    def _use_first_tier(self):
+        return not (
+            self.order_fields or self.group_by is not None or self.is_sliced)
+
+    @_records_skipped
     def first(self):
-        for i in self:
+        """
+        work same as queryset.first
+        every database returns at most one row, an unordered queryset
+        stops at the first tier that has a row
+        """
+        if self._result_cache is not None:
+            return next(iter(self._result_cache), None)
+        if not self._use_first_tier():
+            for i in self[:1]:
+                return i
+            return None
+        for results in self._map_tiers(self._cached("first", _first_rows)):
+            for _, rows in results:
+                if rows:
+                    return self._prefetch_one(rows[0])
+        return None
+
+    @_records_skipped
+    async def afirst(self):
+        """work same as queryset.afirst"""
+        if self._result_cache is not None:
+            return next(iter(self._result_cache), None)
+        if not self._use_first_tier():
+            async for i in self[:1]:
+                return i
+            return None
+        async for results in self._amap_tiers(
+                self._cached("first", _first_rows)):
+            for _, rows in results:
+                if rows:
+                    return await sync_to_async(self._prefetch_one)(rows[0])
+        return None
+
+    @_records_skipped
+    def last(self):
+        """work same as queryset.last"""
+        if self._result_cache is not None:
+            return self._result_cache[-1] if self._result_cache else None
+        queryset = self.reverse() if self.order_fields else self.order_by("-pk")
+        for i in queryset[:1]:
+            return i
+        return None
+
+    @_records_skipped
+    async def alast(self):
+        """work same as queryset.alast"""
+        if self._result_cache is not None:
+            return self._result_cache[-1] if self._result_cache else None
+        queryset = self.reverse() if self.order_fields else self.order_by("-pk")
+        async for i in queryset[:1]:
+            return i
+        return None
+
+    def _earliest(self, fields, latest):
+        """
+        the first row by fields, every database returns at most one row
+        """
+        if self.is_sliced:
+            msg = "Cannot change a query once a slice has been taken."
+            raise TypeError(msg)
+        if not fields:
+            get_latest_by = self.model._meta.get_latest_by
+            if get_latest_by is None:
+                msg = (
+                    "earliest() and latest() require either fields as "
+                    "positional arguments or 'get_latest_by' in the model's Meta."
+                )
+                raise ValueError(msg)
+            fields = (get_latest_by if isinstance(get_latest_by, (list, tuple))
+                      else (get_latest_by,))
+        queryset = self.order_by(*fields)
+        if latest:
+            queryset = queryset.reverse()
+        return queryset[:1]
+
+    def _does_not_exist(self):
+        return self.model.DoesNotExist(
+            f"{self.model._meta.object_name} matching query does not exist.")
+
+    @_records_skipped
+    def earliest(self, *fields):
+        """work same as queryset.earliest"""
+        for i in self._earliest(fields, latest=False):
+            return i
+        raise self._does_not_exist()
+
+    @_records_skipped
+    def latest(self, *fields):
+        """work same as queryset.latest"""
+        for i in self._earliest(fields, latest=True):
+            return i
+        raise self._does_not_exist()
+
+    @_records_skipped
+    async def aearliest(self, *fields):
+        """work same as queryset.aearliest"""
+        async for i in self._earliest(fields, latest=False):
             return i
+        raise self._does_not_exist()
 
-    def create(self, *args, **kwargs):
-        if "default" in self.query_dict:
-            return self.query_dict["default"].create(*args, **kwargs)
-        return self.query_dict.values()[0].create(*args, **kwargs)
+    @_records_skipped
+    async def alatest(self, *fields):
+        """work same as queryset.alatest"""
+        async for i in self._earliest(fields, latest=True):
+            return i
+        raise self._does_not_exist()
+
+    def create(self, **kwargs):
+        """
+        work same as queryset.create
+        the instance is saved to its get_write_database()
+        """
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True, using=obj.get_write_database())
+        return obj
+
+    def bulk_create(self, objs, batch_size=None, **kwargs):
+        """
+        work same as queryset.bulk_create
+        objs are split by get_write_database() and every database
+        inserts its own batches
+        """
+        objs = list(objs)
+        batches = OrderedDict()
+        for obj in objs:
+            batches.setdefault(obj.get_write_database(), []).append(obj)
+        self._map(
+            lambda db_name, query: query.bulk_create(
+                batches[db_name], batch_size=batch_size, **kwargs),
+            OrderedDict(
+                (db_name, QuerySet(model=self.model, using=db_name))
+                for db_name in batches
+            ),
+            partial=False,
+        )
+        self._invalidate(batches)
+        return objs
+
+    def update(self, **kwargs):
+        """
+        work same as queryset.update
+        return the number of rows updated in all the databases
+        """
+        if self.is_sliced:
+            msg = "Cannot update a query once a slice has been taken."
+            raise TypeError(msg)
+        counts = self._map(self._traced(
+            "update", lambda _, query: query.update(**kwargs)),
+            partial=False)
+        self._invalidate(self.query_dict)
+        return sum(count for _, count in counts)
 
+    def delete(self):
+        """
+        work same as queryset.delete
+        return the total and the per model number of deleted objects
+        of all the databases
+        """
+        if self.is_sliced:
+            msg = "Cannot use 'limit' or 'offset' with delete()."
+            raise TypeError(msg)
+        total = 0
+        per_model = {}
+        results = self._map(self._traced(
+            "delete", lambda _, query: query.delete()),
+            partial=False)
+        self._invalidate(self.query_dict)
+        for _, (count, counts) in results:
+            total += count
+            for label, value in counts.items():
+                per_model[label] = per_model.get(label, 0) + value
+        return total, per_model
+
+    def archive(self, source, target, **kwargs):
+        """
+        move the rows matching this queryset from source to target,
+        see django_multidatabase_queryset.archive.archive_queryset
+        for the options
+        """
+        for db_name in (source, target):
+            if db_name not in self.model.DATABASES:
+                msg = (
+                    f"{db_name} is not in the DATABASES of "
+                    f"{self.model._meta.label}."
+                )
+                raise ValueError(msg)
+        if self.is_sliced or self.iterable != "model":
+            msg = "Cannot archive a sliced queryset or values() rows."
+            raise TypeError(msg)
+        if source not in self.query_dict:
+            # the filter can not match any row of source
+            return ArchiveResult()
+        try:
+            return archive_queryset(self.query_dict[source], target, **kwargs)
+        finally:
+            self._invalidate([source, target])
 
-class MultiDataBaseManager(BaseManager.from_queryset(QuerySet)):
+
+class MultiDataBaseManager(BaseManager.from_queryset(MultiQueryset)):
     # pylint: disable=too-few-public-methods
     """
     This Manager will iter all the DATABASES of model
@@ -188,9 +1931,15 @@ class MultiDataBaseManager(BaseManager.from_queryset(QuerySet)):
         """
         iter all the databases and return a MultiQueryset
         """
-        queryset = MultiQueryset(model=self.model)
-        for db_name in self.model.DATABASES:
-            queryset.query_dict[db_name] = super().get_queryset().using(db_name)
+        queryset = MultiQueryset(
+            model=self.model,
+            executor=get_default_executor() if self.model.PARALLEL_QUERY else None,
+        )
+        queryset.template = DatabaseQuerySet(
+            model=self.model, using=self.model.DATABASES[0], hints=self._hints)
+        queryset.databases = self.model.DATABASES
+        if self.model.DEGRADED_QUERY:
+            queryset.skipped_databases = {}
         return queryset
 
 
@@ -198,8 +1947,66 @@ class MultiDataBaseModel(models.Model):
     """
     MultiDataBaseModel can be used when you have multidatabase and want to use these database as one
     """
-    DATABASES = ["default"]
+    DATABASES: ClassVar[list] = ["default"]
+    # query the DATABASES concurrently, see MultiQueryset.parallel
+    PARALLEL_QUERY = False
+    # the values every database holds, filters skip the databases
+    # that can not match, e.g. {"db_cold": {"id": (None, 1000)}},
+    # see django_multidatabase_queryset.ranges
+    DATABASE_RANGES: ClassVar[dict] = {}
+    # the lists of databases exists(), first() and unique get() ask one
+    # after another, e.g. [["default"], ["db_cold"]] to skip the cold
+    # databases when the hot ones have the row
+    DATABASE_TIERS = None
+    # fields whose value can only be in one database, get() by them
+    # stops at the first tier that has the row, e.g. ["pk"]
+    UNIQUE_ACROSS_DATABASES: ClassVar[list] = []
+    # a django_multidatabase_queryset.cache.QueryCache to cache the
+    # results of every database, e.g. for the cold database
+    QUERY_CACHE = None
+    # a django_multidatabase_queryset.tracing.Tracer that receives the
+    # timing of every database and of the merge
+    TRACER = None
+    # databases another database can read as a schema, {alias: (host,
+    # schema)}, they run as one UNION ALL on the host, see
+    # django_multidatabase_queryset.union
+    UNION_DATABASES: ClassVar[dict] = {}
+    # the database that owns every row, e.g. ModuloPartition("pk",
+    # ["default", "db_cold"]), see django_multidatabase_queryset.partitions
+    PARTITION = None
+    # count() uses the statistics of the static databases, see
+    # django_multidatabase_queryset.counts, also count(approximate=True)
+    APPROXIMATE_COUNT = False
+    # the databases counted approximately, with the seconds the exact
+    # count of a filtered query is kept, e.g. {"db_cold": 3600}
+    APPROXIMATE_COUNT_TIMEOUTS: ClassVar[dict] = {}
+    # the seconds a read of a database may run before the database cancels
+    # it, e.g. {"db_cold": 0.5}, see django_multidatabase_queryset.health
+    STATEMENT_TIMEOUTS: ClassVar[dict] = {}
+    # every queryset is degraded, see MultiQueryset.degraded
+    DEGRADED_QUERY = False
+    # the seconds a database that failed is skipped by the degraded
+    # querysets without being asked, 0 asks it every time
+    DEGRADED_RETRY_AFTER = 0
     objects = MultiDataBaseManager()
 
     class Meta:
         abstract = True
+
+    def get_write_database(self):
+        """
+        the database a new instance is created in by the manager,
+        the owner by PARTITION, a ValueError if the partition field is not
+        set yet, the first database whose DATABASE_RANGES holds the
+        instance, otherwise default
+        """
+        db_name = instance_database(self)
+        if db_name is not None:
+            return db_name
+        for db_name in self.DATABASE_RANGES:
+            if instance_in_ranges(
+                    self, database_ranges(self.__class__, db_name)):
+                return db_name
+        if "default" in self.DATABASES:
+            return "default"
+        return self.DATABASES[0]
@@ -0,0 +1,181 @@
+"""
+declare which database owns every row of a MultiDataBaseModel
+
+    class UserAction(MultiDataBaseModel):
+        DATABASES = ["default", "db_cold"]
+        PARTITION = ModuloPartition("pk", ["default", "db_cold"])
+
+create() and the router save a new row to its database, a filter by the
+partition field only queries the databases that own the values. Add the
+router to settings to route save() and the related object lookups
+
+a new row must have its partition field set before it is saved, the
+database has not assigned an autoincrement pk or a default yet, so set the
+pk explicitly, e.g. from a sequence shared by the databases
+
+    DATABASE_ROUTERS = ["django_multidatabase_queryset.partitions.PartitionRouter"]
+"""
+
+
+import zlib
+from abc import ABC, abstractmethod
+
+from django_multidatabase_queryset.ranges import in_range, may_match, resolve_bound
+
+
+class Partition(ABC):
+    """
+    base partition by the value of one field, "pk" is the primary key
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    @abstractmethod
+    def database(self, value):
+        """
+        return the database that owns the rows whose field is value
+        """
+
+    def lookup_databases(self, lookup, value):
+        """
+        return the databases that may hold the rows matching the lookup,
+        None if every database may
+        """
+        if lookup == "exact":
+            return {self.database(value)}
+        if lookup == "in":
+            return {self.database(item) for item in value}
+        return None
+
+    def field_name(self, model):
+        return model._meta.pk.name if self.field == "pk" else self.field
+
+
+class RangePartition(Partition):
+    """
+    {database: (low, high)} like DATABASE_RANGES, low is inclusive, high is
+    exclusive, None is unbounded and a callable bound is evaluated when used,
+    e.g. RangePartition("created", {"default": (recent, None),
+    "db_cold": (None, recent)})
+    """
+
+    def __init__(self, field, ranges):
+        super().__init__(field)
+        self.ranges = ranges
+
+    def database(self, value):
+        for db_name, (low, high) in self.ranges.items():
+            if in_range(value, resolve_bound(low), resolve_bound(high)):
+                return db_name
+        msg = f"No database holds {self.field}={value!r}."
+        raise ValueError(msg)
+
+    def lookup_databases(self, lookup, value):
+        return {
+            db_name for db_name, (low, high) in self.ranges.items()
+            if may_match(resolve_bound(low), resolve_bound(high), lookup, value)
+        }
+
+
+class ModuloPartition(Partition):
+    """
+    the database of an integer value is databases[value % len(databases)]
+    """
+
+    def __init__(self, field, databases):
+        super().__init__(field)
+        self.databases = list(databases)
+
+    def database(self, value):
+        return self.databases[int(value) % len(self.databases)]
+
+
+class HashPartition(ModuloPartition):
+    """
+    modulo of a crc32 of the value, stable across processes unlike hash()
+    """
+
+    def database(self, value):
+        return self.databases[
+            zlib.crc32(str(value).encode()) % len(self.databases)]
+
+
+class CallablePartition(Partition):
+    """
+    function(value) returns the database
+    """
+
+    def __init__(self, field, function):
+        super().__init__(field)
+        self.function = function
+
+    def database(self, value):
+        return self.function(value)
+
+
+def _partition_value(instance, partition):
+    field = instance._meta.get_field(partition.field_name(instance.__class__))
+    return getattr(instance, field.attname)
+
+
+def instance_database(instance):
+    """
+    return the database that owns instance by its PARTITION, None if the
+    model is not partitioned, raise ValueError if the value is not set yet
+    """
+    partition = getattr(instance, "PARTITION", None)
+    if partition is None:
+        return None
+    value = _partition_value(instance, partition)
+    if value is None:
+        # the row would be saved to a database that does not own the
+        # value the database assigns to it
+        msg = (
+            f"Cannot route a {instance._meta.label} whose {partition.field} "
+            "is not set, set it before saving."
+        )
+        raise ValueError(msg)
+    return partition.database(value)
+
+
+class PartitionRouter:
+    """
+    route the partitioned MultiDataBaseModel, the other models are left to
+    the next routers
+    """
+
+    def db_for_read(self, model, **hints):
+        partition = getattr(model, "PARTITION", None)
+        instance = hints.get("instance")
+        if partition is None or instance is None:
+            return None
+        if isinstance(instance, model):
+            if instance._state.db:
+                return instance._state.db
+            value = _partition_value(instance, partition)
+            return None if value is None else partition.database(value)
+        # a related object lookup, e.g. the forward foreign key of instance
+        pk_name = model._meta.pk.name
+        if partition.field_name(model) != pk_name:
+            return None
+        for field in instance._meta.concrete_fields:
+            if (field.is_relation and field.related_model is model
+                    and field.target_field.name == pk_name):
+                value = getattr(instance, field.attname)
+                if value is not None:
+                    return partition.database(value)
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        if getattr(model, "PARTITION", None) is None or not isinstance(
+                instance, model):
+            return None
+        return instance._state.db or instance.get_write_database()
+
+    def allow_relation(self, obj1, obj2, **hints):  # noqa: ARG002
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):  # noqa: ARG002
+        return None
@@ -0,0 +1,114 @@
+"""
+decide which databases can hold the rows of a filter from DATABASE_RANGES
+
+DATABASE_RANGES maps every database to the ranges of the values it holds,
+{field_name: (low, high)}, low is inclusive and high is exclusive, None
+means unbounded and a callable bound is evaluated at query time
+"""
+
+
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+
+RANGE_LOOKUPS = {"exact", "gt", "gte", "lt", "lte", "in", "range"}
+
+
+def lookup_conditions(model, args, kwargs):
+    """
+    yield (field_name, lookup, value) of the conditions all the rows must
+    satisfy, conditions that can not be used for pruning are skipped
+    """
+    for arg in args:
+        if isinstance(arg, Q) and not arg.negated and arg.connector == Q.AND:
+            yield from lookup_conditions(
+                model,
+                [child for child in arg.children if isinstance(child, Q)],
+                dict(child for child in arg.children if isinstance(child, tuple)),
+            )
+    for lookup, value in kwargs.items():
+        name, _, lookup_type = lookup.partition(LOOKUP_SEP)
+        if LOOKUP_SEP in lookup_type:
+            continue
+        if name == "pk":
+            name = model._meta.pk.name
+        lookup_type = lookup_type or "exact"
+        if lookup_type not in RANGE_LOOKUPS:
+            continue
+        if value is None or hasattr(value, "resolve_expression"):
+            continue
+        if lookup_type in ("in", "range") and not isinstance(
+                value, (list, tuple, set, frozenset)):
+            continue
+        yield name, lookup_type, value
+
+
+def database_ranges(model, db_name):
+    """
+    return {field_name: (low, high)} of db_name, pk is replaced by its name
+    """
+    pk_name = model._meta.pk.name
+    return {
+        pk_name if name == "pk" else name: bounds
+        for name, bounds in model.DATABASE_RANGES.get(db_name, {}).items()
+    }
+
+
+def resolve_bound(bound):
+    return bound() if callable(bound) else bound
+
+
+def in_range(value, low, high):
+    return (low is None or low <= value) and (high is None or value < high)
+
+
+def may_match(low, high, lookup, value):
+    """
+    return False only if no value in [low, high) can match the lookup
+    """
+    try:
+        if lookup == "exact":
+            return in_range(value, low, high)
+        if lookup == "in":
+            return any(in_range(item, low, high) for item in value)
+        if lookup in ("gt", "gte"):
+            return high is None or value < high
+        if lookup == "lt":
+            return low is None or low < value
+        if lookup == "lte":
+            return low is None or low <= value
+        start, end = value
+        return (high is None or start < high) and (low is None or low <= end)
+    except TypeError:
+        # values that can not be compared with the bounds never prune
+        return True
+
+
+def may_contain(field_ranges, conditions):
+    """
+    return False if a database with field_ranges can not hold any row
+    matching all the conditions
+    """
+    for name, lookup, value in conditions:
+        if name not in field_ranges:
+            continue
+        low, high = field_ranges[name]
+        if not may_match(resolve_bound(low), resolve_bound(high), lookup, value):
+            return False
+    return True
+
+
+def instance_in_ranges(instance, field_ranges):
+    """
+    return True if every ranged field value of instance is in its range
+    """
+    opts = instance._meta
+    for name, (low, high) in field_ranges.items():
+        value = getattr(instance, opts.get_field(name).attname)
+        if value is None:
+            return False
+        try:
+            if not in_range(value, resolve_bound(low), resolve_bound(high)):
+                return False
+        except TypeError:
+            return False
+    return True
@@ -0,0 +1,177 @@
+"""
+trace the queries of every database and the merge of MultiQueryset
+
+    class UserAction(MultiDataBaseModel):
+        DATABASES = ["default", "db_cold"]
+        TRACER = LoggingTracer()
+
+nothing is measured when the TRACER of the model is None, a tracer may be
+called from the worker threads of a parallel MultiQueryset
+"""
+
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from django.core.exceptions import EmptyResultSet
+
+_END = object()
+
+
+@dataclass
+class QueryEvent:
+    """
+    one query of a database, times are seconds, the first row time is the
+    fetch time unless the rows are streamed by iterator(), rows is None
+    for the queries that do not return rows, e.g. count
+    """
+    model: Any
+    db_name: str
+    kind: str
+    sql: Optional[str]
+    params: tuple
+    first_row_time: float
+    fetch_time: float
+    rows: Optional[int]
+
+
+@dataclass
+class MergeEvent:
+    """
+    the merge of the rows of the databases, the merge time does not include
+    the time the caller spent on the rows but includes reading the rows
+    streamed by iterator(), comparisons is the number of sort key
+    comparisons, None when the groups of values().annotate() are combined
+    """
+    model: Any
+    databases: List[str]
+    rows: int
+    merge_time: float
+    comparisons: Optional[int]
+
+
+class Tracer:
+    """
+    base tracer, override the methods to send the events to your metrics
+    """
+
+    def query(self, event: QueryEvent):
+        pass
+
+    def merge(self, event: MergeEvent):
+        pass
+
+
+class LoggingTracer(Tracer):
+    """
+    log the events at debug level
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger("django_multidatabase_queryset")
+
+    def query(self, event):
+        self.logger.debug(
+            "%s %s on %s: %s rows, first row %.6fs, fetch %.6fs: %s",
+            event.model.__name__, event.kind, event.db_name, event.rows,
+            event.first_row_time, event.fetch_time, event.sql)
+
+    def merge(self, event):
+        self.logger.debug(
+            "%s merge of %s: %d rows, %s comparisons in %.6fs",
+            event.model.__name__, ", ".join(event.databases), event.rows,
+            event.comparisons, event.merge_time)
+
+
+def query_sql(db_name, query):
+    """
+    return the sql and params of the query of a database
+    """
+    try:
+        sql, params = query.query.get_compiler(using=db_name).as_sql()
+    except EmptyResultSet:
+        return None, ()
+    return sql, tuple(params)
+
+
+def traced_function(tracer, kind, function):
+    """
+    wrap function(db_name, query) to send a QueryEvent after every call
+    """
+    def traced(db_name, query):
+        sql, params = query_sql(db_name, query)
+        start = time.perf_counter()
+        result = function(db_name, query)
+        elapsed = time.perf_counter() - start
+        tracer.query(QueryEvent(
+            query.model, db_name, kind, sql, params, elapsed, elapsed,
+            len(result) if isinstance(result, list) else None))
+        return result
+    return traced
+
+
+def traced_iterator(tracer, db_name, query, rows):
+    """
+    yield the streamed rows of a database, then send its QueryEvent
+    """
+    sql, params = query_sql(db_name, query)
+    fetch_time = 0
+    first_row_time = None
+    count = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            row = next(rows, _END)
+            fetch_time += time.perf_counter() - start
+            if first_row_time is None:
+                first_row_time = fetch_time
+            if row is _END:
+                break
+            count += 1
+            yield row
+    finally:
+        tracer.query(QueryEvent(
+            query.model, db_name, "iterator", sql, params,
+            first_row_time or 0, fetch_time, count))
+
+
+def traced_merge(tracer, model, databases, merge):
+    """
+    yield the rows of merge(key_wrapper), then send the MergeEvent,
+    key_wrapper counts the comparisons of the sort keys
+    """
+    comparisons = [0]
+
+    class CountedKey:
+        __slots__ = ("key",)
+
+        def __init__(self, key):
+            self.key = key
+
+        def __eq__(self, other):
+            comparisons[0] += 1
+            return self.key == other.key
+
+        def __lt__(self, other):
+            return self.key < other.key
+
+        __hash__ = None
+
+    rows = merge(CountedKey)
+    merge_time = 0
+    count = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            row = next(rows, _END)
+            merge_time += time.perf_counter() - start
+            if row is _END:
+                break
+            count += 1
+            yield row
+    finally:
+        tracer.merge(MergeEvent(
+            model, list(databases), count, merge_time, comparisons[0]))
+
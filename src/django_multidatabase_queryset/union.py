@@ -0,0 +1,157 @@
+"""
+run the queries of databases that share a server as one UNION ALL
+
+UNION_DATABASES maps a database to (host, schema): the connection of the
+host database can read its table as schema.table, e.g. an sqlite file
+ATTACHed to default as "cold", or a PostgreSQL schema of the same server
+
+    class UserAction(MultiDataBaseModel):
+        DATABASES = ["default", "db_cold"]
+        UNION_DATABASES = {"db_cold": ("default", "cold")}
+
+the host and its schemas are then ordered, sliced, counted and aggregated
+by the host database in one statement
+"""
+
+
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Value
+from django.db.models.query import ModelIterable, QuerySet
+
+# the annotation telling which database a model row comes from
+ALIAS_ANNOTATION = "_multidb_alias"
+
+
+class UnionModelIterable(ModelIterable):
+    """
+    yield the instances of a UNION ALL with the database they come from
+    """
+
+    def __iter__(self):
+        for obj in super().__iter__():
+            obj._state.db = obj.__dict__.pop(ALIAS_ANNOTATION)
+            yield obj
+
+
+def union_host(model, db_name):
+    """
+    return the database whose connection reads the table of db_name
+    """
+    return model.UNION_DATABASES.get(db_name, (db_name, None))[0]
+
+
+def written_databases(model, db_name):
+    """
+    return the databases whose results change when db_name is written,
+    the union results are kept under the host database
+    """
+    host = union_host(model, db_name)
+    return [db_name] if host == db_name else [db_name, host]
+
+
+def _member(schema, queryset, host):
+    """
+    return the query of db_name run by the connection of host
+    """
+    query = queryset.query.clone()
+    query.clear_ordering(force=True)
+    query.clear_limits()
+    if schema is not None:
+        alias = query.get_initial_alias()
+        connection = connections[host]
+        table = query.alias_map[alias]
+        # a quoted name is never quoted again by the compiler
+        query.alias_map[alias] = table.__class__(
+            f"{connection.ops.quote_name(schema)}."
+            f"{connection.ops.quote_name(table.table_name)}",
+            alias)
+    member = QuerySet(model=queryset.model, query=query, using=host)
+    # keep the rows of values() and values_list()
+    member._iterable_class = queryset._iterable_class
+    member._fields = queryset._fields
+    return member
+
+
+def _can_union(queryset):
+    query = queryset.query
+    return not (query.select_related or query.combinator
+                or len(query.alias_map) > 1 or query.group_by is not None)
+
+
+def _union(model, query_dict, member_function):
+    """
+    replace the queries of every host and its schemas by the UNION ALL of
+    member_function(db_name, member), return {db_name: query} and the
+    hosts whose query is a union
+    """
+    hosts = {host for host, _ in model.UNION_DATABASES.values()}
+    groups = OrderedDict()
+    for db_name in query_dict:
+        if db_name in model.UNION_DATABASES or db_name in hosts:
+            groups.setdefault(union_host(model, db_name), []).append(db_name)
+        else:
+            groups[db_name] = None
+    result = OrderedDict()
+    unions = set()
+    for host, db_names in groups.items():
+        if db_names is None:
+            result[host] = query_dict[host]
+            continue
+        if len(db_names) <= 1 or not all(
+                _can_union(query_dict[db_name]) for db_name in db_names):
+            for db_name in db_names:
+                result[db_name] = query_dict[db_name]
+            continue
+        members = [
+            member_function(db_name, _member(
+                model.UNION_DATABASES.get(db_name, (host, None))[1],
+                query_dict[db_name], host))
+            for db_name in db_names
+        ]
+        result[host] = members[0].union(*members[1:], all=True)
+        unions.add(host)
+    return result, unions
+
+
+def union_query_dict(model, query_dict, *, order_fields=(), high_mark=None,
+                     model_rows=True):
+    """
+    replace the queries of every host and its schemas by one UNION ALL
+    query of the host, ordered by order_fields and limited to high_mark
+    """
+    if not model.UNION_DATABASES:
+        return query_dict
+
+    def member_function(db_name, member):
+        if model_rows:
+            return member.annotate(**{ALIAS_ANNOTATION: Value(db_name)})
+        return member
+
+    result, unions = _union(model, query_dict, member_function)
+    for host in unions:
+        queryset = result[host]
+        if order_fields:
+            queryset = queryset.order_by(*order_fields)
+        if high_mark is not None:
+            queryset = queryset[:high_mark]
+        if model_rows:
+            queryset._iterable_class = UnionModelIterable
+        result[host] = queryset
+    return result
+
+
+def union_aggregates(model, query_dict, partials):
+    """
+    like union_query_dict for aggregate(), every database selects one row
+    of its partial aggregates, a constant is never grouped by, so the rows
+    always exist
+    """
+    if not model.UNION_DATABASES:
+        return query_dict
+    return _union(
+        model, query_dict,
+        lambda db_name, member: member.values(
+            **{ALIAS_ANNOTATION: Value(db_name)}).annotate(**partials),
+    )[0]